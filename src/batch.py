@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# wcg-batch: generate world cups without the GUI
+#   ./batch.py countries.json -r rules.json -n 1000 -o cups.jsonl
+# each generated cup is written as one JSON object per line, with the seed
+# that regenerate it (--cup-seed) under the same countries, rules and method
+# the rules file may set the cup format, for a 48 teams cup:
+#   {"format": {"groups": 12, "group_size": 4, "seeded": 1}, "mins": {...}}
+# and separate the regions in the groups, at most two UEFA teams per group:
+#   {"SeparateRegions": true, "group_max": {"UEFA": 2}}
+# the league of a pool of many thousands of countries use every core with
+#   ./batch.py --synthetic 20000 -m parallelleague -j 8
+
+import sys
+import json
+import random
+import argparse
+from functools import partial
+from rng import SeedSequence
+from data import LoadCountries, SyntheticCountries, CupFormat, DEFAULT_FORMAT
+from data import AsCountryTable, LoadRegions, SetRegions
+from quota import QuotaPlan
+from gen import SuperLeague, QuickLeague, AllRandom, WeightedRandom
+from gen import EloLeague, ParallelLeague
+from gen import DefaultRules, GenStats
+from gen import GenerateCup, NeededSlots
+from history import History
+
+METHODS = {'random': AllRandom,
+           'league': SuperLeague,
+           'quickleague': QuickLeague,
+           'weighted': WeightedRandom,
+           'elo': EloLeague,
+           'parallelleague': ParallelLeague}
+
+
+# rules file use the same dict of the RulesEditor, missing values keep default
+def LoadRules(file_name):
+    with open(file_name, 'r') as rules_file:
+        data = json.load(rules_file)
+    fmt = DEFAULT_FORMAT
+    if 'format' in data:
+        fmt = CupFormat(**data['format'])
+    rules = DefaultRules(fmt)
+    for key in ('SeedersOn', 'SeparateRegions'):
+        rules[key] = data.get(key, rules[key])
+    for key in ('mins', 'max', 'group_max'):
+        rules[key].update(data.get(key, {}))
+    return rules
+
+
+# return a message with the problem or None
+def CheckPool(rules, countries, freezed=None):
+    freezed = freezed or {}
+    needed_seeders, needed_non_seeders = NeededSlots(rules, freezed)
+    plan = QuotaPlan(rules, countries, list(freezed.values()),
+                     len(needed_seeders), len(needed_non_seeders))
+    return plan.Problem()
+
+
+# {group name: [country name, ...]}, the seeder slots first
+def ExportCup(slots, fmt):
+    size = fmt.group_size
+    return {g: [c.name for c in slots[i * size:(i + 1) * size]]
+            for i, g in enumerate(fmt.GroupNames())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='wcg-batch',
+        description="Generate World Cups without the GUI, as JSON lines.")
+    parser.add_argument('countries', nargs='?',
+                        help="country file, same format of the Country Editor")
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help="use N random countries instead of a file")
+    parser.add_argument('-r', '--rules',
+                        help="rules file (JSON with 'SeedersOn', 'mins', 'max'"
+                             " and 'format')")
+    parser.add_argument('-m', '--method', choices=sorted(METHODS),
+                        default='random')
+    parser.add_argument('-n', '--count', type=int, default=1,
+                        help="number of cups to generate")
+    parser.add_argument('-s', '--seed', type=int,
+                        help="master seed, cup i use the child stream i")
+    parser.add_argument('--cup-seed', type=int,
+                        help="generate only the cup of this seed")
+    parser.add_argument('--pool-seed', type=int, default=0,
+                        help="seed of the --synthetic countries")
+    parser.add_argument('-o', '--output',
+                        help="output file, default is stdout")
+    parser.add_argument('--regions', metavar='FILE',
+                        help="regions of the countries, JSON {id: name},"
+                             " default is the FIFA confederations")
+    parser.add_argument('-j', '--jobs', type=int,
+                        help="worker processes of the parallelleague"
+                             " method, default is the number of CPUs")
+    parser.add_argument('--history', metavar='FILE',
+                        help="also store the cups in this history file"
+                             " (SQLite, see history.py)")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="write the time and counters of each phase,"
+                             " summed over the cups, as JSON ('-' is stderr)")
+    args = parser.parse_args(argv)
+
+    if (args.countries is None) == (args.synthetic is None):
+        parser.error("give a country file or --synthetic")
+
+    try:
+        # before anything that use the regions
+        if args.regions:
+            SetRegions(LoadRegions(args.regions))
+        if args.synthetic is not None:
+            countries = SyntheticCountries(args.synthetic,
+                                           random.Random(args.pool_seed))
+        else:
+            countries = LoadCountries(args.countries)
+        rules = LoadRules(args.rules) if args.rules else DefaultRules()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        parser.error(str(e))
+
+    # built once, every cup use the same table
+    countries = AsCountryTable(countries)
+    problem = CheckPool(rules, countries)
+    if problem:
+        parser.error(problem)
+
+    if args.cup_seed is not None:
+        seeds = [args.cup_seed]
+    else:
+        master = SeedSequence(args.seed)
+        seeds = (master.Child(i).GenerateSeed() for i in range(args.count))
+
+    method_class = METHODS[args.method]
+    if args.jobs and method_class is ParallelLeague:
+        method_class = partial(ParallelLeague, workers=args.jobs)
+    stats = GenStats() if args.stats else None
+    n_cups = 0
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    history = History(args.history) if args.history else None
+    if history is not None:
+        setup = history.Setup(args.method, rules,
+                              countries=countries.countries)
+    try:
+        for i, seed in enumerate(seeds):
+            # the groups of a few picks can't be separated
+            try:
+                cup = GenerateCup(method_class, rules, countries,
+                                  rng=random.Random(seed), stats=stats)
+            except ValueError as e:
+                parser.exit(1, "{prog}: cup {i}: {e}\n".format(
+                    prog=parser.prog, i=i, e=e))
+            n_cups += 1
+            line = {'cup': i, 'seed': seed, 'method': args.method,
+                    'groups': ExportCup(cup, rules['format'])}
+            out.write(json.dumps(line, ensure_ascii=False))
+            out.write('\n')
+            if history is not None:
+                history.Add(setup, cup, seed)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if history is not None:
+            history.Close()
+
+    if stats is not None:
+        report = dict(stats.exportAsJSONObject(),
+                      cups=n_cups, method=args.method)
+        if args.stats == '-':
+            json.dump(report, sys.stderr, indent=4)
+            sys.stderr.write('\n')
+        else:
+            with open(args.stats, 'w', encoding='utf-8') as stats_file:
+                json.dump(report, stats_file, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
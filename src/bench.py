@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# wcg-bench: time the generation methods and the country file paths,
+# without the GUI, on synthetic pools
+#   ./bench.py                         every case, pools of 64 to 100k
+#   ./bench.py --quick -k league       only the small pools, league cases
+#   ./bench.py --baseline base.json    flag the cases slower than base.json
+# each run is appended to ~/.wcg_bench_history.jsonl (one JSON object per
+# line, see --history) and --save-baseline write the run as the new
+# baseline. A case slower than the baseline by more than --threshold is a
+# regression, the exit status is 1
+# the import of the core modules is checked too, see IMPORT_BUDGET
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from data import LoadCountries, SyntheticCountries, CupFormat, GetRegions
+from data import Country, CountryTable
+from gen import DefaultRules, GenerateCup, IncrementalLeague, LeagueTable
+from batch import METHODS, CheckPool
+from draw import DrawGroups
+import loader
+import countrydb
+from history import History
+
+SIZES = [64, 1024, 16384, 100000]
+QUICK_SIZES = [64, 1024]
+FROZEN = [0, 8, 16]
+
+# the leagues play n² / 2 matches, bigger pools would take hours
+MAX_SIZE = {'league': 1024, 'quickleague': 4096, 'incremental': 2048,
+            'elo': 2048, 'parallelleague': 4096}
+
+# a case is timed until it used this many seconds (or MAX_RUNS runs),
+# the best run is kept
+MIN_TIME = 0.2
+MAX_RUNS = 100
+
+# cups of the history case
+HISTORY_CUPS = 1000
+
+# the runs are machine specific, they are kept out of the source tree
+BENCH_HISTORY = os.path.join(os.path.expanduser('~'),
+                             '.wcg_bench_history.jsonl')
+
+# differences below this many seconds are noise, never a regression
+MIN_DELTA = 0.001
+
+# the worker processes import these modules on every start, they should
+# load fast and without the GUI. {module: seconds}
+IMPORT_BUDGET = {'data': 0.1, 'gen': 0.1, 'countrydb': 0.1}
+GUI_MODULES = ['wx', 'gettext']
+IMPORT_RUNS = 3
+
+_IMPORT_CODE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(' '.join(m for m in {gui!r} if m in sys.modules))
+"""
+
+
+def _rules(name):
+    if name == 'default':
+        return DefaultRules()
+    if name == 'mins':
+        rules = DefaultRules()
+        for r in GetRegions():
+            rules['mins'][r.id] = 3
+        return rules
+    if name == 'max':
+        rules = DefaultRules()
+        for r in GetRegions():
+            rules['max'][r.id] = 6
+        return rules
+    if name == 'noseeders':
+        rules = DefaultRules()
+        rules['SeedersOn'] = False
+        return rules
+    if name == '48teams':
+        return DefaultRules(CupFormat(12, 4))
+    raise ValueError(name)
+
+
+RULES = ['default', 'mins', 'max', 'noseeders', '48teams']
+
+
+# k countries of different regions in the first k slots
+def _freezed(countries, k):
+    by_region = {}
+    for c in countries:
+        by_region.setdefault(c.region.id, []).append(c)
+    chosen = []
+    while len(chosen) < k:
+        for same in by_region.values():
+            if same and len(chosen) < k:
+                chosen.append(same.pop())
+    return {i: c for i, c in enumerate(chosen)}
+
+
+# (name, function) of every case, the setup is done here and not timed
+# the files of the I/O cases are written in folder
+# wanted(name) tell if a case will run, the others skip their setup
+def Cases(sizes, seed, folder, wanted=lambda name: True):
+    for n in sizes:
+        countries = SyntheticCountries(n, random.Random(seed))
+        # like batch.py, the generations share one table of the pool
+        pool = CountryTable(countries)
+
+        for rules_name in RULES:
+            rules = _rules(rules_name)
+            for k in FROZEN:
+                freezed = _freezed(countries, k)
+                if CheckPool(rules, pool, freezed):
+                    continue
+                yield ('feasibility/{r}/frozen{k}/n{n}'.format(
+                           r=rules_name, k=k, n=n),
+                       lambda r=rules, f=freezed: CheckPool(r, pool, f))
+
+                for method_name in sorted(METHODS):
+                    if n > MAX_SIZE.get(method_name, n):
+                        continue
+                    method_class = METHODS[method_name]
+                    rng = random.Random(seed)
+                    yield ('gen/{m}/{r}/frozen{k}/n{n}'.format(
+                               m=method_name, r=rules_name, k=k, n=n),
+                           lambda m=method_class, r=rules, f=freezed, g=rng:
+                               GenerateCup(m, r, pool, f, g))
+
+        # the group draw alone, of a cup with the regions separated
+        name = 'draw/separate/n{n}'.format(n=n)
+        if wanted(name):
+            rules = _rules('default')
+            rules['SeparateRegions'] = True
+            rng = random.Random(seed)
+            cup = GenerateCup(METHODS['random'], rules, pool, rng=rng)
+            yield name, lambda r=rules, c=cup, g=rng: DrawGroups(r, c, (), g)
+
+        # one country edited between two generations, of copies so the
+        # other cases keep the pool as it was
+        name = 'gen/incremental-edit/n{n}'.format(n=n)
+        if n <= MAX_SIZE['incremental'] and wanted(name):
+            edited = [Country(c.name, c.region, c.seeder, c.win_chance)
+                      for c in countries]
+            table = LeagueTable()
+            rng = random.Random(seed)
+            table.Update(edited, rng)
+            rules = DefaultRules()
+
+            def edit_and_generate(table=table, rng=rng, rules=rules):
+                c = edited[rng.randrange(n)]
+                c.win_chance = c.win_chance % 100 + 1
+                method = IncrementalLeague(rules, edited, [], 8, 24, rng,
+                                           table=table)
+                method.GetSelections(8, isSeeder=True)
+                method.GetSelections(24)
+            yield name, edit_and_generate
+
+        yield from _ioCases(countries, n, folder, seed, wanted)
+
+
+def _ioCases(countries, n, folder, seed, wanted):
+    json_file = os.path.join(folder, 'countries.json')
+    db_file = os.path.join(folder, 'countries' + countrydb.EXTENSION)
+    history_file = os.path.join(folder, 'history{n}.db'.format(n=n))
+
+    # same file of CountryEditor.onSaveCountries
+    def save_json():
+        with open(json_file, 'w+') as outfile:
+            to_save = {c.name: c.exportAsJSONObject() for c in countries}
+            json.dump(to_save, outfile, indent=4)
+
+    def stream_json():
+        with open(json_file, 'rb') as data_file:
+            for line, key, entry in loader.IterJSONObject(data_file):
+                loader.ParseCountry(entry)
+
+    # the load cases can run alone
+    save_json()
+    countrydb.Save(db_file, countries)
+
+    yield 'io/json-save/n{n}'.format(n=n), save_json
+    yield ('io/json-load/n{n}'.format(n=n),
+           lambda: LoadCountries(json_file))
+    yield 'io/json-stream/n{n}'.format(n=n), stream_json
+    yield ('io/wcgdb-save/n{n}'.format(n=n),
+           lambda: countrydb.Save(db_file, countries))
+    yield ('io/wcgdb-load/n{n}'.format(n=n),
+           lambda: countrydb.Load(db_file))
+
+    # HISTORY_CUPS cups written in one batch, the file grows on every run
+    name = 'io/history-append/n{n}'.format(n=n)
+    if wanted(name):
+        rules = DefaultRules()
+        rng = random.Random(seed)
+        cups = [GenerateCup(METHODS['random'], rules, countries, rng=rng)
+                for i in range(HISTORY_CUPS)]
+
+        def append_history():
+            with History(history_file) as history:
+                setup = history.Setup('random', rules)
+                for i, cup in enumerate(cups):
+                    history.Add(setup, cup, i)
+        yield name, append_history
+
+
+# best time of function, in seconds
+def Time(function):
+    gc.collect()
+    best = None
+    spent = 0.0
+    for i in range(MAX_RUNS):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        spent += elapsed
+        if spent >= MIN_TIME:
+            break
+    return best
+
+
+# (seconds, GUI modules loaded) of importing module in a new interpreter
+def ImportTime(module):
+    code = _IMPORT_CODE.format(module=module, gui=GUI_MODULES)
+    out = subprocess.run([sys.executable, '-c', code],
+                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                         stdout=subprocess.PIPE, universal_newlines=True,
+                         check=True).stdout.split('\n')
+    return float(out[0]), out[1].split()
+
+
+# time the imports of IMPORT_BUDGET, return the results and a list with
+# the problems (over the budget or loading the GUI)
+def CheckImports(wanted=lambda name: True, out=sys.stdout):
+    results = {}
+    problems = []
+    for module, budget in sorted(IMPORT_BUDGET.items()):
+        name = 'import/{m}'.format(m=module)
+        if not wanted(name):
+            continue
+        runs = [ImportTime(module) for i in range(IMPORT_RUNS)]
+        results[name] = min(seconds for seconds, gui in runs)
+        out.write("{:<48} {:>12.6f}\n".format(name, results[name]))
+        if results[name] > budget:
+            problems.append("{m} import take {s:.3f}s, budget {b:.3f}s".format(
+                m=module, s=results[name], b=budget))
+        if runs[0][1]:
+            problems.append("{m} import load {gui}".format(
+                m=module, gui=', '.join(runs[0][1])))
+    return results, problems
+
+
+# {case: (seconds, baseline seconds)} of the cases slower than the
+# baseline by more than threshold (0.25 => 25%)
+def Regressions(results, baseline, threshold):
+    slower = {}
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if seconds > before * (1 + threshold) and seconds - before > MIN_DELTA:
+            slower[name] = (seconds, before)
+    return slower
+
+
+# return the results and the import problems, see CheckImports
+def Run(sizes, seed, patterns=(), out=sys.stdout):
+    def wanted(name):
+        return not patterns or any(p in name for p in patterns)
+
+    results, problems = CheckImports(wanted, out)
+    with tempfile.TemporaryDirectory(prefix='wcg-bench-') as folder:
+        for name, function in Cases(sizes, seed, folder, wanted):
+            if not wanted(name):
+                continue
+            results[name] = Time(function)
+            out.write("{:<48} {:>12.6f}\n".format(name, results[name]))
+            out.flush()
+    return results, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='wcg-bench',
+        description="Time the World Cup generation and the country files.")
+    parser.add_argument('-k', '--filter', action='append', default=[],
+                        metavar='TEXT',
+                        help="only the cases with TEXT in the name,"
+                             " can be repeated")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help="pool sizes, default {}".format(SIZES))
+    parser.add_argument('--quick', action='store_true',
+                        help="only the pools of {}".format(QUICK_SIZES))
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help="seed of the pools and the draws")
+    parser.add_argument('--history', default=BENCH_HISTORY,
+                        help="append the run to this file, '' to skip,"
+                             " default is ~/.wcg_bench_history.jsonl")
+    parser.add_argument('--baseline',
+                        help="results to compare with (JSON of a run)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="write this run to the --baseline file")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="slowdown that is a regression, default 0.25")
+    args = parser.parse_args(argv)
+
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline need --baseline")
+
+    sizes = QUICK_SIZES if args.quick else args.sizes
+    results, problems = Run(sizes, args.seed, args.filter)
+    run = {'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+           'python': platform.python_version(),
+           'machine': platform.platform(),
+           'seed': args.seed,
+           'sizes': sizes,
+           'results': results}
+
+    if args.history:
+        with open(args.history, 'a', encoding='utf-8') as history:
+            history.write(json.dumps(run) + '\n')
+
+    status = 0
+    for problem in problems:
+        print("IMPORT " + problem)
+        status = 1
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as out:
+            json.dump(run, out, indent=4)
+    elif args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as base:
+            baseline = json.load(base)['results']
+        slower = Regressions(results, baseline, args.threshold)
+        for name, (seconds, before) in sorted(slower.items()):
+            print("REGRESSION {:<48} {:.6f}s, was {:.6f}s (x{:.2f})".format(
+                name, seconds, before, seconds / before))
+        if slower:
+            status = 1
+        else:
+            print("no regressions against {}".format(args.baseline))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
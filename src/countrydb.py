@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+# Binary country database (.wcgdb), a columnar file that is memory-mapped
+# and read lazily, made for pools of hundreds of thousands of countries.
+#
+# Layout, little-endian, every section aligned to 8 bytes:
+#   header        magic, version, countries (n), regions (r),
+#                 offset of each section below
+#   name index    uint32[n + 1], country i name is strings[idx[i]:idx[i+1]]
+#   region        uint16[n], index in the region table
+#   seeder        uint8[n], 0 or 1
+#   win chance    uint16[n]
+#   region index  uint32[r + 1], region ids, like the name index
+#   strings       utf-8 text of every region id and country name
+#
+# Load give a CountryTable whose columns are the arrays of the file, the
+# Country objects are only built for the indexes asked (the picked ones)
+
+import sys
+import mmap
+import struct
+from array import array
+from data import Country, CountryTable, GetRegionById, GetRegistry
+from i18n import _
+
+MAGIC = b'WCGDB\0'
+VERSION = 1
+EXTENSION = '.wcgdb'
+HEADER = struct.Struct('<6sHII6Q')
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def Save(file_name, countries):
+    region_ids = []
+    region_codes = {}
+    for c in countries:
+        if c.region.id not in region_codes:
+            region_codes[c.region.id] = len(region_ids)
+            region_ids.append(c.region.id)
+
+    strings = bytearray()
+
+    def index(texts):
+        idx = array('I', [0])
+        for t in texts:
+            strings.extend(t.encode('utf-8'))
+            idx.append(len(strings))
+        return idx
+
+    # region ids first, then the names, in the same blob
+    region_index = index(region_ids)
+    name_index = index(c.name for c in countries)
+    name_index[0] = region_index[-1]
+    regions = array('H', (region_codes[c.region.id] for c in countries))
+    seeders = array('B', (1 if c.seeder else 0 for c in countries))
+    try:
+        chances = array('H', (c.win_chance for c in countries))
+    except (TypeError, OverflowError):
+        raise ValueError("win_chance should be an integer from 0 to 65535")
+
+    sections = [name_index, regions, seeders, chances, region_index]
+    if sys.byteorder != 'little':
+        for s in sections:
+            s.byteswap()
+    sections = [s.tobytes() for s in sections] + [bytes(strings)]
+
+    offsets = []
+    position = _align(HEADER.size)
+    for s in sections:
+        offsets.append(position)
+        position = _align(position + len(s))
+
+    with open(file_name, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(countries),
+                              len(region_ids), *offsets))
+        for offset, s in zip(offsets, sections):
+            out.write(b'\0' * (offset - out.tell()))
+            out.write(s)
+
+
+# read only view of a .wcgdb file, nothing is parsed until asked
+# raise ValueError if the file is not a country database
+class CountryDB:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.file = open(file_name, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            self.file.close()
+            raise ValueError("Not a country database")
+
+        if len(self.map) < HEADER.size:
+            self.Close()
+            raise ValueError("Not a country database")
+        magic, version, n, n_regions, *offsets = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.Close()
+            raise ValueError("Not a country database")
+
+        self.count = n
+        view = memoryview(self.map)
+        self._views = [view]
+        self.name_index = self._column(view, offsets[0], 'I', n + 1)
+        self.region = self._column(view, offsets[1], 'H', n)
+        self.seeder = self._column(view, offsets[2], 'B', n)
+        self.win_chance = self._column(view, offsets[3], 'H', n)
+        region_index = self._column(view, offsets[4], 'I', n_regions + 1)
+        self.strings = view[offsets[5]:]
+        self._views.append(self.strings)
+
+        self.regions = []
+        for i in range(n_regions):
+            region_id = self._text(region_index, i)
+            region = GetRegionById(region_id)
+            if region is None:
+                self.Close()
+                raise ValueError(
+                    _("Region '{region}' don't exist").format(region=region_id))
+            self.regions.append(region)
+
+    def _column(self, view, offset, fmt, n):
+        size = struct.calcsize(fmt)
+        column = view[offset:offset + n * size]
+        if len(column) != n * size:
+            self.Close()
+            raise ValueError("Country database is truncated")
+        if sys.byteorder != 'little' and size > 1:
+            swapped = array(fmt, column.tobytes())
+            swapped.byteswap()
+            return swapped
+        column = column.cast(fmt)
+        self._views.append(column)
+        return column
+
+    def _text(self, index, i):
+        return bytes(self.strings[index[i]:index[i + 1]]).decode('utf-8')
+
+    def __len__(self):
+        return self.count
+
+    def Name(self, i):
+        return self._text(self.name_index, i)
+
+    def Region(self, i):
+        return self.regions[self.region[i]]
+
+    def Country(self, i):
+        return Country(self.Name(i), self.Region(i),
+                       bool(self.seeder[i]), self.win_chance[i])
+
+    # all the countries at once, faster than one Country(i) per index
+    def Countries(self):
+        strings = bytes(self.strings)
+        index = self.name_index.tolist()
+        regions = self.regions
+        return [Country(strings[index[i]:index[i + 1]].decode('utf-8'),
+                        regions[r], bool(s), w)
+                for i, (r, s, w) in enumerate(zip(self.region.tolist(),
+                                                  self.seeder.tolist(),
+                                                  self.win_chance.tolist()))]
+
+    def Close(self):
+        for v in reversed(getattr(self, '_views', [])):
+            v.release()
+        self._views = []
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+
+# {file name: CountryDB} opened to unpickle a LazyCountries, one per file
+# in each process, they stay open until it ends
+_unpickled = {}
+
+
+# the countries of a CountryDB as a sequence. A Country is built the first
+# time its index is asked and then kept, the same index is always the same
+# object (countries compare by identity)
+class LazyCountries:
+    def __init__(self, db):
+        self.db = db
+        # {index: Country} and {Country: index} of the ones built
+        self._built = {}
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.db)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        country = self._built.get(i)
+        if country is None:
+            if not 0 <= i < len(self):
+                raise IndexError("country index out of range")
+            country = self._built[i] = self.db.Country(i)
+            self._ids[country] = i
+        return country
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    # index of the country, None if it didn't come from here
+    def Index(self, country):
+        return self._ids.get(country)
+
+    # to another process go the file name and the countries already built,
+    # so the ones given with it (like the freezed) keep their index
+    def __getstate__(self):
+        return {'file_name': self.db.file_name, 'built': self._built}
+
+    def __setstate__(self, state):
+        db = _unpickled.get(state['file_name'])
+        if db is None:
+            db = _unpickled[state['file_name']] = CountryDB(state['file_name'])
+        self.db = db
+        self._built = state['built']
+        self._ids = {c: i for i, c in self._built.items()}
+
+
+# CountryTable of a CountryDB, the seeder and win chance columns are the
+# arrays of the file (the chances are integers here), the region column
+# too when the file keep the regions in the order of the registry.
+# The file stays open while the table is used
+class CountryDBTable(CountryTable):
+    def __init__(self, db, registry=None):
+        registry = registry or GetRegistry()
+        self._setColumns(LazyCountries(db), list(registry.regions))
+
+    def _setColumns(self, countries, regions):
+        db = countries.db
+        self.countries = countries
+        self.regions = regions
+        codes = {r.id: code for code, r in enumerate(regions)}
+        region_codes = [codes[r.id] for r in db.regions]
+        if region_codes == list(range(len(region_codes))):
+            self.region = db.region
+        else:
+            self.region = array('H', map(region_codes.__getitem__,
+                                         db.region))
+        self.seeder = db.seeder
+        self.win_chance = db.win_chance
+        self._index = None
+        self._groups = None
+
+    def Index(self, country):
+        return self.countries.Index(country)
+
+    def __getstate__(self):
+        return {'countries': self.countries, 'regions': self.regions}
+
+    def __setstate__(self, state):
+        self._setColumns(state['countries'], state['regions'])
+
+
+# the countries of the file as a CountryDBTable
+def Load(file_name):
+    return CountryDBTable(CountryDB(file_name))
@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import os
 import json
 import wx
-from data import Country, Region, GetRegions, GetRegionById
+import wx.dataview as dv
+import loader
+import countrydb
+from data import Country, Region, GetRegions
+from countrymodel import CountryModel
+
+# steps of the load progress bar
+PROGRESS_RANGE = 1000
+# invalid countries listed after a load
+MAX_ERRORS_SHOWN = 20
+# pause in the typing before a new name is applied
+NAME_DELAY_MS = 150
 
 class CountryEditor(wx.Dialog):
     def __init__(self, parent, countries):
@@ -12,84 +24,141 @@ class CountryEditor(wx.Dialog):
                            pos=wx.DefaultPosition,
                            size=wx.Size(510,350),
                            style=wx.DEFAULT_DIALOG_STYLE|wx.RESIZE_BORDER)
+        self.colours = {"red": wx.Colour(255,200,200,255),
+                        "dark": wx.Colour(200,230,200,255),
+                        "light": wx.Colour(255,255,255,255)}
+        # every country lives in the model, the view only draw what is shown
+        self.model = CountryModel(self.colours)
         self.gui_init()
-        self.country_list = countries
+        # the editor change copies of the countries, so a Cancel leave them
+        # as they were, applyChanges copy the edits back on OK
+        # {copy: the country of the caller}
+        self.originals = {}
+        self.country_list = []
+        for c in countries:
+            copy = Country(c.name, c.region, c.seeder, c.win_chance)
+            self.originals[copy] = c
+            self.country_list.append(copy)
         self.panel_editing.Disable()
         self.btn_remove.Disable()
         self.btn_add.Disable()
-        self.colours = {"red": wx.Colour(255,200,200,255),
-                        "dark": wx.Colour(200,230,200,255),
-                        "light": wx.Colour(255,255,255,255)}
 
-        # {region obj: item on tree}
-        self.regions = {}
+        # background load of a country file, see onLoadCountries
+        self.loader = None
+        self.progress = None
+        self.load_errors = []
 
-        # {contry obj: item on tree}
-        self.countries = {}
+        # (country, name) typed but not applied yet, see onName
+        self.pending_name = None
+        self.name_timer = None
 
     def getCountriesList(self):
-        return [c for c in self.countries.keys()]
+        return self.model.Countries()
+
+    # give the edits to the countries of the caller and return them, with
+    # the added ones and without the removed ones. The same objects are
+    # kept, the frozen slots and the history know them
+    def applyChanges(self):
+        countries = []
+        for c in self.getCountriesList():
+            original = self.originals.get(c)
+            if original is None:
+                countries.append(c)
+                continue
+            original.name = c.name
+            original.region = c.region
+            original.seeder = c.seeder
+            original.win_chance = c.win_chance
+            countries.append(original)
+        return countries
+
+    # RegionCounts of getCountriesList, kept by the model
+    def getRegionCounts(self):
+        return self.model.counts
 
     def onInit(self, event):
         self.SetMinSize(self.GetSize())
-        # add a root item, will be invisible because wxTR_HIDE_ROOT
-        self.root = self.tree_countries.AddRoot("Region")
-        # load regions
         for r in GetRegions():
-            tree_item = self.tree_countries.AppendItem(self.root, r.name)
-            self.tree_countries.SetItemData(tree_item, r)
-            self.regions[r] = tree_item
-            self.cmb_region.Append(r.name, r)
-        self._sortTree()
+            self.cmb_region.Append(_(r.name), r)
 
         # setup countries if any
         if len(self.country_list) > 0:
-            whatToDo = []
-            for c in self.country_list:
-                rGUI = self.regions[c.region]
-                whatToDo.append([rGUI, c])
-            self._buildCountriesTree(whatToDo)
-
-
+            self.model.Reset(self.country_list)
 
     def onLoadCountries(self, event):
         file_name = self._callFileDialog(_("Open File"),
                                          wx.FD_OPEN |
                                          wx.FD_FILE_MUST_EXIST)
-        if file_name is None:
+        if file_name is None or self.loader is not None:
             return
+        self._applyName()
+
+        # start from an empty list, the countries arrive in batches
+        self.model.Reset([])
+        self.load_errors = []
+        self.progress = wx.ProgressDialog(
+            _("Load from File"),
+            _("Reading {file}").format(file=os.path.basename(file_name)),
+            maximum=PROGRESS_RANGE, parent=self,
+            style=wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME |
+                  wx.PD_REMAINING_TIME)
+
+        # the loader run on its own thread, every callback come back to
+        # the GUI thread with wx.CallAfter
+        def later(method):
+            return lambda *args: wx.CallAfter(method, country_loader, *args)
+
+        country_loader = loader.CountryLoader(file_name,
+                                              later(self._onLoadBatch),
+                                              later(self._onLoadError),
+                                              later(self._onLoadProgress),
+                                              later(self._onLoadDone))
+        self.loader = country_loader
+        country_loader.start()
+
+    # calls of an old or cancelled loader are ignored
+    def _onLoadBatch(self, country_loader, batch):
+        if country_loader is self.loader:
+            self.model.AddCountries(batch)
+
+    def _onLoadError(self, country_loader, line, message):
+        if country_loader is self.loader:
+            self.load_errors.append((line, message))
+
+    def _onLoadProgress(self, country_loader, fraction):
+        if country_loader is not self.loader:
+            return
+        keep_going, skip = self.progress.Update(int(fraction * PROGRESS_RANGE))
+        if not keep_going:
+            country_loader.Cancel()
 
-        with open(file_name, 'r') as data_file:
-            try:
-                data = json.load(data_file)
-            except:
-                wx.MessageBox(_("File is corrupt"
-                                " or invalid JSON"),
-                              _('Fail to read the file'),
-                              wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
-                return
-
-            to_include = []
-            for v in data.values():
-                name = v['name']
-                seeder = v['seeder']
-                region_id = v['region']
-                win_chance = v['win_chance']
-                region = GetRegionById(region_id)
-                if region is None:
-                    wx.MessageBox(
-                        _("Region '{region}' of Country '{country}' don't exist").format(
-                            region=region_id, country=name),
-                        _('Invalid Region'),
-                        wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
-                    return
-
-                tree_item = self.regions[region]
-                c = Country(name, region, seeder, win_chance)
-                to_include.append([tree_item, c])
-        self._buildCountriesTree(to_include)
+    # error is None, a message or False when the user cancelled
+    def _onLoadDone(self, country_loader, error):
+        if country_loader is not self.loader:
+            return
+        self.loader = None
+        self.progress.Destroy()
+        self.progress = None
+
+        if error:
+            wx.MessageBox(error,
+                          _('Fail to read the file'),
+                          wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
+        if self.load_errors:
+            lines = [_("Line {line}: {message}").format(line=l, message=m)
+                     for l, m in self.load_errors[:MAX_ERRORS_SHOWN]]
+            if len(self.load_errors) > MAX_ERRORS_SHOWN:
+                lines.append(_("... and {n} more").format(
+                    n=len(self.load_errors) - MAX_ERRORS_SHOWN))
+            wx.MessageBox(
+                _("{n} countries were not loaded:").format(
+                    n=len(self.load_errors)) + "\n" + "\n".join(lines),
+                _('Invalid Countries'),
+                wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
+        self.load_errors = []
 
     def onSaveCountries(self, event):
+        self._applyName()
         duplicated = self._anyDuplicatedCountry()
         if duplicated:
             wx.MessageBox(
@@ -104,44 +173,46 @@ class CountryEditor(wx.Dialog):
         if fileName is None:
             return
 
+        if fileName.endswith(countrydb.EXTENSION):
+            try:
+                countrydb.Save(fileName, self.getCountriesList())
+            except (OSError, ValueError) as e:
+                wx.MessageBox(str(e),
+                              _('Fail to save the file'),
+                              wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
+            return
+
         with open(fileName, 'w+') as outfile:
             to_save = {c.name: c.exportAsJSONObject()
                        for c in self.getCountriesList()}
             json.dump(to_save, outfile, indent=4)
 
     def onAddCountry(self, event):
-        region_item = self.tree_countries.GetSelection()
-        region_data = self.tree_countries.GetItemData(region_item)
-
+        self._applyName()
+        selected = self._selected()
         # if the selected item is a country, get the region
-        if isinstance(region_data, Country):
-            region_item = self.tree_countries.GetItemParent(region_item)
-            region_data = self.tree_countries.GetItemData(region_item)
+        if isinstance(selected, Country):
+            region = selected.region
+        else:
+            region = selected
 
         # create a new country and append in the GUI
-        c = Country(u"", region_data)
-        new_item = self.tree_countries.AppendItem(region_item, c.name)
-
-        self._syncTreeData(new_item, c)
-        self._updateRegionCounter()
-        self.tree_countries.SelectItem(new_item)
+        c = Country(u"", region)
+        self.model.Add(c)
+        self._select(c)
         self.txt_country.SetFocus()
         self.sld_winchance.SetValue(c.win_chance)
 
     def onRemoveCountry(self, event):
-        item = self.tree_countries.GetSelection()
-        data = self.tree_countries.GetItemData(item)
-        if isinstance(data, Country):
-            region = self.tree_countries.GetItemParent(item)
-            self.tree_countries.SelectItem(region)
-            self.tree_countries.Delete(item)
-            self.countries.pop(data)
-        self._updateColors()  # update colors to 'fix' possible old duplicates
-        self._updateRegionCounter()
+        self._applyName()
+        c = self._selected()
+        if isinstance(c, Country):
+            self.model.Remove(c)
+            self._select(c.region)
 
     def onCountrySelection(self, event):
-        item = event.GetItem()  # get the selection
-        s = self.tree_countries.GetItemData(item)  # get the selection Data
+        self._applyName()  # a name typed in the country left behind
+        s = self._selected()  # get the selection Data
 
         # Region clicked -> disable country editing
         if isinstance(s, Region):
@@ -151,58 +222,66 @@ class CountryEditor(wx.Dialog):
 
         # Country clicked -> load values and enable controls
         elif isinstance(s, Country):
-            self.cmb_region.SetValue(s.region.name)
-            self.txt_country.SetValue(s.name)
+            self.cmb_region.SetValue(_(s.region.name))
+            self.txt_country.ChangeValue(s.name)
             self.chk_seeder.SetValue(s.seeder)
             self.sld_winchance.SetValue(s.win_chance)
             self.panel_editing.Enable()
             self.btn_remove.Enable()
             self.btn_add.Enable()
 
+    # a burst of typing is applied once, after a short pause
     def onName(self, event):
-        new_name = self.txt_country.GetValue()
-
-        cGUI = self.tree_countries.GetSelection()  # get the selected item (country item)
-        c = self.tree_countries.GetItemData(cGUI)  # get the data (country object)
-
-        self.tree_countries.SetItemText(cGUI, new_name)  # update text on GUI
-        c.name = new_name  # update text on data
-
-        rGUI = self.tree_countries.GetItemParent(cGUI)  # get the region item
-        self.tree_countries.SortChildren(rGUI)  # sort the region items
-
-        self._updateColors()  # check country names and update gui color
+        c = self._selected()
+        if not isinstance(c, Country):
+            return
+        self.pending_name = (c, self.txt_country.GetValue())
+        if self.name_timer is None:
+            self.name_timer = wx.CallLater(NAME_DELAY_MS, self._applyName)
+        else:
+            self.name_timer.Restart(NAME_DELAY_MS)
 
-    # update the country region in the tree when region get updated
+    def _applyName(self):
+        if self.name_timer is not None:
+            self.name_timer.Stop()
+        if self.pending_name is None:
+            return
+        c, name = self.pending_name
+        self.pending_name = None
+
+        # keep the region sorted, the model move the row if needed, and
+        # recolor only the countries whose duplicate state changed
+        was_selected = self._selected() is c
+        self.model.Rename(c, name)
+        # a row that moved lose the selection
+        if was_selected and self._selected() is not c:
+            self._select(c)
+
+    # update the country region in the view when region get updated
     def onRegion(self, event):
+        self._applyName()
         pos = self.cmb_region.GetCurrentSelection()
         region = self.cmb_region.GetClientData(pos)
-        region_tree_item = self.regions[region]
-
-        old_item = self.tree_countries.GetSelection()
-        country = self.tree_countries.GetItemData(old_item)
+        country = self._selected()
 
-        country.region = region
-        new_item = self.tree_countries.AppendItem(region_tree_item,
-                                                  country.name)
-        self._syncTreeData(new_item, country)
-
-        self.tree_countries.Delete(old_item)
-        self.tree_countries.SortChildren(region_tree_item)
-        self.tree_countries.SelectItem(new_item)
+        self.model.Move(country, region)
+        self._select(country)
 
     def onWinChance(self, event):
-        country_gui = self.tree_countries.GetSelection()
-        country = self.tree_countries.GetItemData(country_gui)
+        country = self._selected()
         country.win_chance = self.sld_winchance.GetValue()
 
     def onSeed(self, event):
-        item = self.tree_countries.GetSelection()
-        c = self.tree_countries.GetItemData(item)
-        c.seeder = not c.seeder
-        self._updateColors()
+        c = self._selected()
+        self.model.SetSeeder(c, not c.seeder)
 
     def onClose(self, event):
+        self._applyName()
+        if self.loader is not None:
+            self.loader.Cancel()
+            self.loader = None
+            self.progress.Destroy()
+            self.progress = None
         duplicated = self._anyDuplicatedCountry()
         if duplicated:
             dlg = wx.MessageDialog(
@@ -217,88 +296,35 @@ class CountryEditor(wx.Dialog):
             self.EndModal(wx.ID_CANCEL)
         else:
             self.EndModal(wx.ID_OK)
-        self.tree_countries.DeleteAllItems()
         self.Destroy()
 
     def _anyDuplicatedCountry(self):
-        dup = self._getDuplicateCountries()
-        if len(dup) > 0:
-            return dup.pop()
-        else:
-            return False
-
-    def _sortTree(self):
-        for region_item in self.regions.values():
-            self.tree_countries.SortChildren(region_item)
-        self.tree_countries.SortChildren(self.root)
-
-    def _getDuplicateCountries(self):
-        seen = set()
-        duplicates = set()
-        for c in self.countries.keys():
-            if c.name not in seen:
-                seen.add(c.name)
-            else:
-                duplicates.add(c.name)
-        return duplicates
-
-    # update every country item color
-    def _updateColors(self):
-        duplicates = self._getDuplicateCountries()
-
-        for c, gui_item in self.countries.items():
-            if c.name in duplicates:
-                index = "red"
-            else:
-                if c.seeder:
-                    index = "dark"
-                else:
-                    index = "light"
-            self.tree_countries.SetItemBackgroundColour(gui_item,
-                                                        self.colours[index])
-
-    # update the counter in region titles
-    def _updateRegionCounter(self):
-        for r, tree_item in self.regions.items():
-            count = self.tree_countries.GetChildrenCount(tree_item)
-            if count > 0:
-                self.tree_countries.SetItemText(tree_item,
-                                                "{name} ({i})".format(
-                                                    name=r.name, i=count))
-            else:
-                self.tree_countries.SetItemText(tree_item, "{name}".format(
-                    name=r.name))
-
-    # list of actions to fill the region nodes
-    # to_do is a list of (region gui/tree node, country)
-    # it add each country on the given region
-    def _buildCountriesTree(self, to_do):
-        # delete all countries references & gui nodes
-        self.countries.clear()
-        for region_item in self.regions.values():
-            self.tree_countries.DeleteChildren(region_item)
-
-        # fill the tree
-        for region_item, country in to_do:
-            new_item = self.tree_countries.AppendItem(region_item,
-                                                      country.name)
-            self._syncTreeData(new_item, country)
-
-        # update the tree
-        self._sortTree()
-        self._updateColors()
-        self._updateRegionCounter()
-
-    # create references gui <-> data to fast access
-    def _syncTreeData(self, gui_item, country):
-        self.tree_countries.SetItemData(gui_item, country)
-        self.countries[country] = gui_item
+        for name in self.model.duplicates:
+            return name
+        return False
+
+    # the object (Region or Country) of the selected row, or None
+    def _selected(self):
+        item = self.dv_countries.GetSelection()
+        if not item:
+            return None
+        return self.model.ItemToObject(item)
+
+    def _select(self, obj):
+        item = self.model.ObjectToItem(obj)
+        self.dv_countries.Select(item)
+        self.dv_countries.EnsureVisible(item)
 
     def _callFileDialog(self, text, flags):
-        file_dialog = wx.FileDialog(self, text, "", "",
-                                    "JSON file (*.json)|*.json", flags)
+        wildcard = _("JSON file (*.json)|*.json|"
+                     "Country database (*.wcgdb)|*.wcgdb")
+        file_dialog = wx.FileDialog(self, text, "", "", wildcard, flags)
         loaded = file_dialog.ShowModal()
         file_path = file_dialog.GetPath()
+        # the save dialog don't add the extension by itself
+        if (flags & wx.FD_SAVE and file_dialog.GetFilterIndex() == 1 and
+                not file_path.endswith(countrydb.EXTENSION)):
+            file_path += countrydb.EXTENSION
         file_dialog.Destroy()
 
         if loaded != wx.ID_OK:
@@ -320,9 +346,15 @@ class CountryEditor(wx.Dialog):
 
         self.SetSizeHints(wx.Size(-1,-1), wx.DefaultSize)
 
-        self.tree_countries = wx.TreeCtrl(self, wx.ID_ANY, wx.DefaultPosition,
-                                          wx.Size(-1,-1),
-                                          wx.TR_DEFAULT_STYLE|wx.TR_HIDE_ROOT)
+        self.dv_countries = dv.DataViewCtrl(self, wx.ID_ANY,
+                                            wx.DefaultPosition,
+                                            wx.Size(-1,-1),
+                                            dv.DV_NO_HEADER|dv.DV_SINGLE)
+        self.dv_countries.AssociateModel(self.model)
+        # the control hold a reference now
+        self.model.DecRef()
+        self.dv_countries.AppendTextColumn(text_country, 0,
+                                           width=wx.COL_WIDTH_AUTOSIZE)
         self.btn_load = wx.Button(self, wx.ID_ANY,
                                   text_load,
                                   wx.DefaultPosition, wx.DefaultSize, 0)
@@ -416,7 +448,7 @@ class CountryEditor(wx.Dialog):
         sizer_addremove.Add(self.btn_remove, 0, wx.ALL, 5)
 
         sizer_tree = wx.GridSizer(1, 1, 0, 0)
-        sizer_tree.Add(self.tree_countries, 0, wx.ALL|wx.EXPAND, 5)
+        sizer_tree.Add(self.dv_countries, 0, wx.ALL|wx.EXPAND, 5)
 
         sizer_ctrl = wx.BoxSizer(wx.VERTICAL)
         sizer_ctrl.Add(self.btn_load, 0, wx.ALL|wx.EXPAND, 5)
@@ -435,8 +467,8 @@ class CountryEditor(wx.Dialog):
 
         self.Bind(wx.EVT_CLOSE, self.onClose)
         self.Bind(wx.EVT_INIT_DIALOG, self.onInit)
-        self.tree_countries.Bind(wx.EVT_TREE_SEL_CHANGED,
-                                 self.onCountrySelection)
+        self.dv_countries.Bind(dv.EVT_DATAVIEW_SELECTION_CHANGED,
+                               self.onCountrySelection)
         self.btn_load.Bind(wx.EVT_BUTTON, self.onLoadCountries)
         self.btn_save.Bind(wx.EVT_BUTTON, self.onSaveCountries)
         self.btn_add.Bind(wx.EVT_BUTTON, self.onAddCountry)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+# Data model of the Country Editor. The DataViewCtrl only ask for the rows
+# it draws, so the cost of the editor don't grow with the number of
+# countries. Regions are the top level items, each one keep its countries
+# in a list sorted by name (and a parallel list of the names, for bisect)
+
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from operator import attrgetter
+import wx.dataview as dv
+from data import Country, Region, RegionCounts, GetRegions
+
+# a batch this many times smaller than its region is inserted country by
+# country, a bigger one is merged with the region in a single pass
+MERGE_RATIO = 8
+
+
+class CountryModel(dv.PyDataViewModel):
+    def __init__(self, colours):
+        dv.PyDataViewModel.__init__(self)
+        # deleted countries should not stay alive in the item mapper
+        self.UseWeakRefs(True)
+        self.colours = colours
+        self.regions = sorted(GetRegions(), key=lambda r: _(r.name))
+
+        # {region id: countries sorted by name}, {region id: their names}
+        self.rows = {r.id: [] for r in self.regions}
+        self.names = {r.id: [] for r in self.regions}
+
+        # {name: countries with that name}, kept updated on every change,
+        # the names used by more than one country are painted in red
+        self.by_name = {}
+        self.duplicates = set()
+        # countries and seeders per region, for the RulesEditor
+        self.counts = RegionCounts()
+
+    # every country, region by region
+    def Countries(self):
+        return [c for r in self.regions for c in self.rows[r.id]]
+
+    # replace all the countries
+    def Reset(self, countries):
+        for r in self.regions:
+            self.rows[r.id] = []
+            self.names[r.id] = []
+        self.by_name = {}
+        self.duplicates = set()
+        self.counts = RegionCounts()
+        self._extend(countries)
+        self.Cleared()
+
+    # add many countries at once, like a batch of a file being loaded
+    # only the batch is sorted, and only the batch is notified to the view
+    def AddCountries(self, countries):
+        batches, recolor = self._extend(countries)
+        for batch in batches.values():
+            region_item = self.ObjectToItem(batch[0].region)
+            items = dv.DataViewItemArray()
+            for c in batch:
+                items.append(self.ObjectToItem(c))
+            self.ItemsAdded(region_item, items)
+            self.ItemChanged(region_item)
+        # the countries already shown that got a duplicated name
+        for c in recolor:
+            self.ItemChanged(self.ObjectToItem(c))
+
+    def Add(self, country):
+        self._insert(country)
+        self._notifyAdded(country)
+
+    def Remove(self, country):
+        self._delete(country)
+        self._notifyDeleted(country)
+
+    def Rename(self, country, name):
+        if country.name == name:
+            return
+        names = self.names[country.region.id]
+        old = self._index(country)
+        new = bisect_right(names, name)
+        # same place, only the text changed
+        if new in (old, old + 1):
+            self._removeName(country, True)
+            country.name = name
+            names[old] = name
+            self._addName(country, True)
+            self.ItemChanged(self.ObjectToItem(country))
+            return
+        self.Remove(country)
+        country.name = name
+        self.Add(country)
+
+    def Move(self, country, region):
+        self.Remove(country)
+        country.region = region
+        self.Add(country)
+
+    def SetSeeder(self, country, seeder):
+        self.counts.Remove(country)
+        country.seeder = seeder
+        self.counts.Add(country)
+        self.Changed(country)
+
+    # the country changed something drawn
+    def Changed(self, country):
+        self.ItemChanged(self.ObjectToItem(country))
+
+    # return the batch of each region sorted by name, and the countries
+    # of before the batch whose name is now duplicated
+    def _extend(self, countries):
+        batches = {}
+        for c in countries:
+            batches.setdefault(c.region.id, []).append(c)
+            self.counts.Add(c)
+
+        by_name = attrgetter('name')
+        for region_id, batch in batches.items():
+            batch.sort(key=by_name)
+            rows = self.rows[region_id]
+            names = self.names[region_id]
+            if len(batch) * MERGE_RATIO < len(rows):
+                # the batch is sorted, each one goes after the one before
+                i = 0
+                for c in batch:
+                    i = bisect_right(names, c.name, i)
+                    names.insert(i, c.name)
+                    rows.insert(i, c)
+                    i += 1
+            else:
+                # stable, so the same name keep the old country first
+                rows = list(merge(rows, batch, key=by_name))
+                self.rows[region_id] = rows
+                self.names[region_id] = [c.name for c in rows]
+
+        recolor = []
+        added = {id(c) for batch in batches.values() for c in batch}
+        for batch in batches.values():
+            for c in batch:
+                # the new ones are drawn after, nothing to recolor
+                first = self._addName(c, False)
+                if first is not None and id(first) not in added:
+                    recolor.append(first)
+        return batches, recolor
+
+    def _index(self, country):
+        region_id = country.region.id
+        rows = self.rows[region_id]
+        i = bisect_left(self.names[region_id], country.name)
+        while rows[i] is not country:
+            i += 1
+        return i
+
+    def _insert(self, country):
+        region_id = country.region.id
+        i = bisect_right(self.names[region_id], country.name)
+        self.names[region_id].insert(i, country.name)
+        self.rows[region_id].insert(i, country)
+        self.counts.Add(country)
+        self._addName(country, True)
+
+    def _delete(self, country):
+        region_id = country.region.id
+        i = self._index(country)
+        del self.names[region_id][i]
+        del self.rows[region_id][i]
+        self.counts.Remove(country)
+        self._removeName(country, True)
+
+    # a name that become duplicated (or stop being) change the color of
+    # the other country that has it, only that one is redrawn
+    # _addName return that other country, None if the color didn't change
+    def _addName(self, country, notify):
+        same = self.by_name.setdefault(country.name, [])
+        same.append(country)
+        if len(same) == 2:
+            self.duplicates.add(country.name)
+            if notify:
+                self.ItemChanged(self.ObjectToItem(same[0]))
+            return same[0]
+        return None
+
+    def _removeName(self, country, notify):
+        same = self.by_name[country.name]
+        same.remove(country)
+        if len(same) == 1:
+            self.duplicates.discard(country.name)
+            if notify:
+                self.ItemChanged(self.ObjectToItem(same[0]))
+        elif not same:
+            del self.by_name[country.name]
+
+    def _notifyAdded(self, country):
+        region_item = self.ObjectToItem(country.region)
+        self.ItemAdded(region_item, self.ObjectToItem(country))
+        # the counter in the region title
+        self.ItemChanged(region_item)
+
+    def _notifyDeleted(self, country):
+        region_item = self.ObjectToItem(country.region)
+        self.ItemDeleted(region_item, self.ObjectToItem(country))
+        self.ItemChanged(region_item)
+
+    # wx.dataview interface
+
+    def GetColumnCount(self):
+        return 1
+
+    def GetColumnType(self, col):
+        return 'string'
+
+    def IsContainer(self, item):
+        if not item:
+            return True
+        return isinstance(self.ItemToObject(item), Region)
+
+    def GetParent(self, item):
+        if not item:
+            return dv.NullDataViewItem
+        obj = self.ItemToObject(item)
+        if isinstance(obj, Country):
+            return self.ObjectToItem(obj.region)
+        return dv.NullDataViewItem
+
+    def GetChildren(self, parent, children):
+        if not parent:
+            objects = self.regions
+        else:
+            obj = self.ItemToObject(parent)
+            objects = self.rows[obj.id] if isinstance(obj, Region) else []
+        for obj in objects:
+            children.append(self.ObjectToItem(obj))
+        return len(objects)
+
+    def GetValue(self, item, col):
+        obj = self.ItemToObject(item)
+        if isinstance(obj, Region):
+            count = self.counts.Countries(obj.id)
+            if count > 0:
+                return "{name} ({i})".format(name=_(obj.name), i=count)
+            return _(obj.name)
+        return obj.name
+
+    # the editing panel change the countries, not the view
+    def SetValue(self, value, item, col):
+        return False
+
+    def GetAttr(self, item, col, attr):
+        obj = self.ItemToObject(item)
+        if not isinstance(obj, Country):
+            return False
+        if obj.name in self.duplicates:
+            attr.SetBackgroundColour(self.colours["red"])
+        elif obj.seeder:
+            attr.SetBackgroundColour(self.colours["dark"])
+        else:
+            return False
+        return True
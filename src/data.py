@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import random
+from array import array
 import attr
 from attr.validators import instance_of
+from i18n import _, N_
 
 
 @attr.s(frozen=True)
 class Region:
     id = attr.ib()
     name = attr.ib()
+    # index in its RegionRegistry, for the lists and arrays by region
+    code = attr.ib(default=0, eq=False)
 
 
 @attr.s(eq=False)
@@ -26,21 +31,275 @@ class Country:
         }
 
 
-_REGIONS = [['AFC', _("Asia")],
-            ['CAF', _("Africa")],
-            ['CONCACAF', _("North and Central America")],
-            ['CONMEBOL', _("South America")],
-            ['OFC', _("Oceania")],
-            ['UEFA', _("Europe")]]
+# groups of a world cup, the first 'seeded' slots of each group
+# are the seeder ones
+@attr.s(frozen=True)
+class CupFormat:
+    groups = attr.ib(default=8)
+    group_size = attr.ib(default=4)
+    seeded = attr.ib(default=1)
+
+    def __attrs_post_init__(self):
+        if self.groups < 1 or self.group_size < 1:
+            raise ValueError("A World Cup need at least one group and slot")
+        if not 0 <= self.seeded <= self.group_size:
+            raise ValueError("Seeded slots should fit in the group")
+
+    @property
+    def teams(self):
+        return self.groups * self.group_size
+
+    # A..Z, then AA, AB...
+    def GroupName(self, group):
+        name = ''
+        group += 1
+        while group:
+            group, r = divmod(group - 1, 26)
+            name = chr(ord('A') + r) + name
+        return name
+
+    def GroupNames(self):
+        return [self.GroupName(g) for g in range(self.groups)]
+
+    def IsSeederSlot(self, slot):
+        return slot % self.group_size < self.seeded
+
+    def exportAsJSONObject(self):
+        return {
+            'groups': self.groups,
+            'group_size': self.group_size,
+            'seeded': self.seeded
+        }
+
+
+DEFAULT_FORMAT = CupFormat()
+
+# formats offered by the GUI
+CUP_FORMATS = [DEFAULT_FORMAT,
+               CupFormat(12, 4),
+               CupFormat(16, 4),
+               CupFormat(32, 4)]
+
+
+# the names are translated when shown, _(region.name)
+_REGIONS = [['AFC', N_("Asia")],
+            ['CAF', N_("Africa")],
+            ['CONCACAF', N_("North and Central America")],
+            ['CONMEBOL', N_("South America")],
+            ['OFC', N_("Oceania")],
+            ['UEFA', N_("Europe")]]
+
+
+# the regions a country can have, in order, region i has the code i
+class RegionRegistry:
+    def __init__(self, regions=()):
+        self.regions = []
+        self.by_id = {}
+        for id, name in regions:
+            self.Add(id, name)
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __iter__(self):
+        return iter(self.regions)
+
+    def Add(self, id, name):
+        if self.Get(id) is not None:
+            raise ValueError(_("Region '{region}' repeated").format(region=id))
+        region = Region(id, name, len(self.regions))
+        self.regions.append(region)
+        self.by_id[id] = region
+        return region
+
+    # the region, or None if the id don't exist
+    def Get(self, id):
+        try:
+            return self.by_id.get(id)
+        except TypeError:
+            # not hashable, can't be a region id
+            return None
+
+    def Code(self, id):
+        return self.by_id[id].code
+
+
+# regions of a JSON file, {id: name} in the order they should be shown:
+#   {"UEFA": "Europe", "NORDIC": "Nordic countries"}
+# raise ValueError if the file is not like that
+def LoadRegions(file_name):
+    import json
+    with open(file_name, 'r', encoding='utf-8') as data_file:
+        data = json.load(data_file)
+    if not isinstance(data, dict) or not data:
+        raise ValueError(_("The region file should be an object"
+                           " of region id: name"))
+    registry = RegionRegistry()
+    for id, name in data.items():
+        if not isinstance(name, str):
+            raise ValueError(_("Region '{region}' need a name").format(
+                region=id))
+        registry.Add(id, name)
+    return registry
+
+
+_registry = RegionRegistry(_REGIONS)
 
-_REGIONS_OBJECTS = [Region(id, name) for id, name in _REGIONS]
 
+# the regions used by every module, set before any country is loaded,
+# the countries keep the Region objects of the registry they were made with
+def SetRegions(registry):
+    global _registry
+    _registry = registry
+
+def GetRegistry():
+    return _registry
 
 def GetRegions():
-    return _REGIONS_OBJECTS
+    return _registry.regions
 
 def GetRegionById(id):
-    for r in _REGIONS_OBJECTS:
-        if id == r.id:
-            return r
-    return None
+    return _registry.Get(id)
+
+
+# countries and seeders of each region, updated one country at time so
+# nobody rescans the pool to know them. The CountryModel keep one for the
+# countries being edited, the GUI pass it to the RulesEditor
+class RegionCounts:
+    def __init__(self, countries=(), registry=None):
+        self.registry = registry or GetRegistry()
+        self.countries = [0] * len(self.registry)
+        self.seeders = [0] * len(self.registry)
+        for c in countries:
+            self.Add(c)
+
+    def Add(self, country, sign=1):
+        code = self.registry.Code(country.region.id)
+        self.countries[code] += sign
+        if country.seeder:
+            self.seeders[code] += sign
+
+    # call it before the country change its region or seeder flag,
+    # and Add after
+    def Remove(self, country):
+        self.Add(country, -1)
+
+    def Countries(self, region_id):
+        return self.countries[self.registry.Code(region_id)]
+
+    def Seeders(self, region_id):
+        return self.seeders[self.registry.Code(region_id)]
+
+    def Total(self):
+        return sum(self.countries)
+
+    @property
+    def regions(self):
+        return self.registry.regions
+
+    # {region id: [non seeders, seeders]}, like CountryTable.Counts
+    def Counts(self):
+        return {r.id: [self.countries[r.code] - self.seeders[r.code],
+                       self.seeders[r.code]]
+                for r in self.registry}
+
+# build the countries from a JSON file in the 'coutries_PT.json' format,
+# or a CountryTable over a binary country database (see countrydb.py),
+# AsCountryTable take both
+# raise ValueError if some country have a region that don't exist
+def LoadCountries(file_name):
+    if file_name.endswith('.wcgdb'):
+        import countrydb
+        return countrydb.Load(file_name)
+
+    # json is only needed here, keep it out of the import time
+    import json
+    with open(file_name, 'r') as data_file:
+        data = json.load(data_file)
+
+    countries = []
+    for v in data.values():
+        region = GetRegionById(v['region'])
+        if region is None:
+            raise ValueError(
+                _("Region '{region}' of Country '{country}' don't exist").format(
+                    region=v['region'], country=v['name']))
+        countries.append(Country(v['name'], region,
+                                 v['seeder'], v['win_chance']))
+    return countries
+
+
+# random countries, to test big pools
+def SyntheticCountries(n, rnd=random):
+    regions = GetRegions()
+    return [Country("Country {i}".format(i=i),
+                    rnd.choice(regions),
+                    rnd.random() < 0.2,
+                    rnd.randint(1, 100))
+            for i in range(n)]
+
+
+# the countries of a pool as columns, used by the generators
+# country i is countries[i], region[i] is its region code (the code of the
+# registry, index of regions), seeder[i] is 0 or 1 and win_chance[i] its
+# chance.
+# The columns make the generators faster, they don't save memory: the
+# table keep every Country too, the methods return them. Only a pool of a
+# .wcgdb file (countrydb.CountryDBTable) build the countries when asked.
+# Built once and never changed, so many runs (and processes) can share it,
+# the runs keep their own scratch lists (like the league points)
+class CountryTable:
+    def __init__(self, countries, registry=None):
+        registry = registry or GetRegistry()
+        self.countries = tuple(countries)
+        self.regions = list(registry.regions)
+        codes = registry.by_id
+        self.region = array('H', [codes[c.region.id].code
+                                  for c in self.countries])
+        self.seeder = array('B', [1 if c.seeder else 0
+                                  for c in self.countries])
+        self.win_chance = array('d', [c.win_chance for c in self.countries])
+
+        # built on the first use, see Index and Groups
+        self._index = None
+        self._groups = None
+
+    def __len__(self):
+        return len(self.countries)
+
+    # id of the country, or None if it is not in the table
+    def Index(self, country):
+        if self._index is None:
+            self._index = {c: i for i, c in enumerate(self.countries)}
+        return self._index.get(country)
+
+    # {(region code, seeder): array of ids}
+    def Groups(self):
+        if self._groups is None:
+            self._groups = {}
+            for i, key in enumerate(zip(self.region, self.seeder)):
+                group = self._groups.get(key)
+                if group is None:
+                    group = self._groups[key] = array('l')
+                group.append(i)
+        return self._groups
+
+    # {region id: [non seeders, seeders]}
+    def Counts(self):
+        counts = {r.id: [0, 0] for r in self.regions}
+        for (code, seeder), ids in self.Groups().items():
+            counts[self.regions[code].id][seeder] = len(ids)
+        return counts
+
+    # the table pickled to another process don't carry the caches
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+
+# the table of countries, which may already be one
+def AsCountryTable(countries):
+    if isinstance(countries, CountryTable):
+        return countries
+    return CountryTable(countries)
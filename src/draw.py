@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+# Group draw of a world cup. The teams picked by a GenMethod are placed in
+# the groups so no group has more teams of a region than rules['group_max']
+# allows (FIFA: one per confederation, two for UEFA). The teams picked for
+# the seeder slots stay in seeder slots and the others in the others, like
+# the pots of a real draw, no seeder is left in a non seeded slot (see
+# quota.SeedersApart) and the freezed slots don't move.
+#
+# A backtracking search, with constraint propagation, finds a valid draw:
+# the most limited regions are placed first, each team in a random group
+# with room, and after each one the teams left should still fit, every pot
+# alone and all together. A search that spends DRAW_NODES nodes per team
+# starts again with other random choices, at most DRAW_RESTARTS times, so
+# a draw never takes long and progress can stop it. The order
+# of the search favours some draws, so it is followed by MIX_SWAPS random
+# swaps per team: two slots of the same pot trade their teams when the
+# groups keep the limits. The swaps keep the uniform distribution, but a
+# few of them per team don't reach it, so the draw is only approximately
+# uniform: every valid draw can come out, some more often than others.
+# More swaps get it closer, for a few microseconds per team each.
+
+import random
+from data import GetRegions
+from quota import SeedersApart
+from i18n import _
+
+# teams of a region allowed in the same group, the others have 1
+GROUP_LIMITS = {'UEFA': 2}
+
+# random swaps tried per team after the search, the draw gets closer to
+# uniform with more of them
+MIX_SWAPS = 5
+
+# nodes of the search per team before it starts again, and its attempts
+DRAW_NODES = 20
+DRAW_RESTARTS = 50
+# nodes between two progress calls
+PROGRESS_NODES = 64
+
+
+# {region id: teams allowed in the same group} of the regions in use
+def DefaultGroupLimits():
+    return {r.id: GROUP_LIMITS.get(r.id, 1) for r in GetRegions()}
+
+
+# slots of the cup is the list of the generated cup, fixed the slots that
+# can't move (the freezed ones). Return a new list with the other teams
+# drawn in the groups, raise ValueError if no draw keep the limits
+# progress as in GroupDraw.Draw
+def DrawGroups(rules, slots, fixed=(), rng=None, progress=None):
+    return GroupDraw(rules, slots, fixed).Draw(rng or random, progress)
+
+
+# the search used all its nodes
+class _OutOfNodes(Exception):
+    pass
+
+
+class GroupDraw:
+    def __init__(self, rules, slots, fixed=()):
+        fmt = rules['format']
+        self.size = fmt.group_size
+        self.slots = list(slots)
+        limits = rules.get('group_max') or {}
+        # slots of the seeders that are not seeder slots
+        self.misplaced = []
+        if SeedersApart(rules):
+            self.misplaced = [i for i, c in enumerate(self.slots)
+                              if c.seeder and not fmt.IsSeederSlot(i)]
+
+        # regions as small codes, counts[group][code] of the fixed teams
+        codes = {}
+        for c in self.slots:
+            codes.setdefault(c.region.id, len(codes))
+        self.limit = [0] * len(codes)
+        for region_id, code in codes.items():
+            self.limit[code] = limits.get(region_id, 1)
+        self.counts = [[0] * len(codes) for g in range(fmt.groups)]
+
+        # pots: (free slots, teams), placed one after the other
+        pots = {}
+        for i, c in enumerate(self.slots):
+            if i in fixed:
+                self.counts[i // self.size][codes[c.region.id]] += 1
+                continue
+            pot = rules['SeedersOn'] and fmt.IsSeederSlot(i)
+            free, teams = pots.setdefault(pot, ([], []))
+            free.append(i)
+            teams.append(c)
+
+        # the teams of a pot, the most limited regions first: many teams
+        # and a small limit
+        region_teams = [0] * len(codes)
+        for c in self.slots:
+            region_teams[codes[c.region.id]] += 1
+        self.pots = []
+        for pot in sorted(pots, reverse=True):
+            free, teams = pots[pot]
+            order = sorted(
+                range(len(teams)),
+                key=lambda t: (-region_teams[codes[teams[t].region.id]] /
+                               max(1, self.limit[codes[teams[t].region.id]]),
+                               t))
+            self.pots.append((free, [(teams[t], codes[teams[t].region.id])
+                                     for t in order]))
+
+    # progress(stage, done, total) is called while searching, stage 'draw'
+    # and done the nodes tried, it can raise an exception to stop the draw
+    def Draw(self, rng, progress=None):
+        if self.misplaced:
+            raise ValueError(_("The seeder {name} is in a non seeded"
+                               " slot.").format(
+                                   name=self.slots[self.misplaced[0]].name))
+        # the freezed teams alone may break a limit
+        for group in self.counts:
+            if any(n > self.limit[code] for code, n in enumerate(group)):
+                raise ValueError(_("The regions can't be separated in"
+                                   " the groups."))
+        found = self.Search(rng, progress)
+        if found is None:
+            raise ValueError(_("The regions can't be separated in"
+                               " the groups."))
+        if found is False:
+            raise ValueError(_("No draw separating the regions was found,"
+                               " try again."))
+        slots, counts = found
+        self._mix(slots, counts, rng)
+        return slots
+
+    # a valid draw as (slots, counts), None if there is none or False if
+    # none was found in DRAW_RESTARTS attempts. Each attempt is a
+    # randomized search of at most DRAW_NODES nodes per team, a search
+    # that went the wrong way early start again with other random choices
+    def Search(self, rng, progress=None):
+        budget = DRAW_NODES * sum(len(teams) for free, teams in self.pots)
+        for attempt in range(DRAW_RESTARTS):
+            try:
+                return self._attempt(rng, budget, progress)
+            except _OutOfNodes:
+                pass
+        return False
+
+    # The teams left fit while no slack is negative:
+    #   region_slack[p][c]  room for the region c in the groups, over the
+    #                       free slots of the pot p, minus its teams left
+    #   total_slack[c]      the same for all the pots, they share the limits
+    #   group_slack[p][g]   teams left of the pot p that the group g still
+    #                       allow, minus its free slots
+    # the room of the region c in the group g is min(free slots, limit of
+    # c - teams of c in g). The slacks are kept updated by move(), a team
+    # placed only change the ones of its pot, region and group
+    def _attempt(self, rng, budget, progress):
+        size = self.size
+        limit = self.limit
+        codes = range(len(limit))
+        counts = [list(group) for group in self.counts]
+        slots = list(self.slots)
+        groups = range(len(counts))
+        pots = range(len(self.pots))
+        # by pot: the teams of each region not placed yet and the free
+        # slots of each group, steps are (team, region code, pot, free
+        # slots of the pot by group) in the order placed
+        steps = []
+        left = []
+        space = []
+        for p, (free, teams) in enumerate(self.pots):
+            room = {}
+            space.append([0] * len(counts))
+            for i in free:
+                room.setdefault(i // size, []).append(i)
+                space[p][i // size] += 1
+            left.append([0] * len(limit))
+            for team, code in teams:
+                steps.append((team, code, p, room))
+                left[p][code] += 1
+        total_space = [sum(space[p][g] for p in pots) for g in groups]
+
+        region_slack = [[sum(min(space[p][g], limit[c] - counts[g][c])
+                             for g in groups) - left[p][c] for c in codes]
+                        for p in pots]
+        total_slack = [sum(min(total_space[g], limit[c] - counts[g][c])
+                           for g in groups) - sum(left[p][c] for p in pots)
+                       for c in codes]
+        group_slack = [[sum(left[p][c] for c in codes
+                            if counts[g][c] < limit[c]) - space[p][g]
+                        for g in groups] for p in pots]
+        if (min(total_slack, default=0) < 0 or
+                any(min(slack, default=0) < 0
+                    for slack in region_slack + group_slack)):
+            return None
+
+        # place (d = 1) or take back (d = -1) a team of the region code
+        # and the pot p in the group g
+        def move(code, p, g, d):
+            group = counts[g]
+            pot_slack = region_slack[p]
+            # the room of the group g, out
+            s = space[p][g]
+            t = total_space[g]
+            for c in codes:
+                free = limit[c] - group[c]
+                pot_slack[c] -= s if s < free else free
+                total_slack[c] -= t if t < free else free
+            free = limit[code] - group[code]
+            for q in pots:
+                if q != p:
+                    s = space[q][g]
+                    region_slack[q][code] -= s if s < free else free
+            allowed_before = group[code] < limit[code]
+
+            group[code] += d
+            left[p][code] -= d
+            space[p][g] -= d
+            total_space[g] -= d
+
+            # the room of the group g, in
+            s = space[p][g]
+            t = total_space[g]
+            for c in codes:
+                free = limit[c] - group[c]
+                pot_slack[c] += s if s < free else free
+                total_slack[c] += t if t < free else free
+            free = limit[code] - group[code]
+            for q in pots:
+                if q != p:
+                    s = space[q][g]
+                    region_slack[q][code] += s if s < free else free
+            # one team less to place, one free slot less in g
+            pot_slack[code] += d
+            total_slack[code] += d
+            group_slack[p][g] += d
+            pot_groups = group_slack[p]
+            for h in groups:
+                if h != g and counts[h][code] < limit[code]:
+                    pot_groups[h] -= d
+            # the teams of the region allowed in g, before and after
+            allowed = group[code] < limit[code]
+            for q in pots:
+                n = left[q][code]
+                before = n + d if q == p else n
+                group_slack[q][g] += ((n if allowed else 0) -
+                                      (before if allowed_before else 0))
+
+        # the slacks move() changed are not negative
+        def fits(code, p, g):
+            if min(region_slack[p]) < 0 or min(total_slack) < 0:
+                return False
+            if min(group_slack[p]) < 0:
+                return False
+            for q in pots:
+                if region_slack[q][code] < 0 or group_slack[q][g] < 0:
+                    return False
+            return True
+
+        randrange = rng.randrange
+        nodes = [0]
+
+        def place(step):
+            if step == len(steps):
+                return True
+            nodes[0] += 1
+            if nodes[0] > budget:
+                raise _OutOfNodes()
+            if progress is not None and nodes[0] % PROGRESS_NODES == 0:
+                progress('draw', nodes[0], budget)
+            team, code, p, room = steps[step]
+            candidates = [g for g, room_slots in room.items()
+                          if room_slots and counts[g][code] < limit[code]]
+            # the groups in a random order, drawn one at a time
+            while candidates:
+                k = randrange(len(candidates))
+                g = candidates[k]
+                candidates[k] = candidates[-1]
+                candidates.pop()
+                room_slots = room[g]
+                i = room_slots.pop(randrange(len(room_slots)))
+                move(code, p, g, 1)
+                slots[i] = team
+                if fits(code, p, g) and place(step + 1):
+                    return True
+                move(code, p, g, -1)
+                room_slots.append(i)
+            return False
+
+        if not place(0):
+            return None
+        return slots, counts
+
+    # random swaps of two teams of the same pot, done when both groups
+    # keep the limits. The swap is symmetric (a draw and its swapped one
+    # are picked with the same chance), so the uniform chance of every
+    # valid draw is kept and the bias of the search fades, though MIX_SWAPS
+    # swaps per team leave some of it
+    def _mix(self, slots, counts, rng):
+        limit = self.limit
+        # region code and group counts of every slot
+        codes = {id(team): c for free, teams in self.pots for team, c in teams}
+        code = [codes.get(id(team)) for team in slots]
+        group = [counts[i // self.size] for i in range(len(slots))]
+        # the slots of a pot, each one repeated as a pair key: a pot is
+        # chosen with the chance of its size, then two of its slots
+        picks = [(i, free) for free, teams in self.pots if len(free) > 1
+                 for i in free]
+        if not picks:
+            return
+        randrange = rng.randrange
+        n_picks = len(picks)
+        for swap in range(MIX_SWAPS * n_picks):
+            i, free = picks[randrange(n_picks)]
+            j = free[randrange(len(free))]
+            ci = code[i]
+            cj = code[j]
+            if ci == cj:
+                continue
+            gi = group[i]
+            gj = group[j]
+            if gi is gj or gj[ci] >= limit[ci] or gi[cj] >= limit[cj]:
+                continue
+            gi[ci] -= 1
+            gj[ci] += 1
+            gj[cj] -= 1
+            gi[cj] += 1
+            code[i] = cj
+            code[j] = ci
+            slots[i], slots[j] = slots[j], slots[i]
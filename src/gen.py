@@ -1,94 +1,800 @@
 # -*- coding: utf-8 -*-
 
+import os
 import random
-import operator
-from collections import Counter
-from itertools import combinations
-from data import GetRegions
+from time import perf_counter
+from array import array
+from itertools import repeat
+from math import log10
+from operator import add, sub
+from data import GetRegions, AsCountryTable, DEFAULT_FORMAT
+from quota import QuotaPlan, RegionMax, SeedersApart
+from draw import DrawGroups, DefaultGroupLimits
+from rng import SeedSequence
+
+
+# rules used when the user don't set any
+# with 'SeparateRegions' the groups are drawn keeping 'group_max', see draw.py
+def DefaultRules(fmt=DEFAULT_FORMAT):
+    rules = {'SeedersOn': True, 'mins': {}, 'max': {}, 'format': fmt,
+             'SeparateRegions': False, 'group_max': DefaultGroupLimits()}
+    for r in GetRegions():
+        rules['mins'][r.id] = 0
+        rules['max'][r.id] = fmt.teams
+    return rules
+
+
+# timers (seconds) and counters of the phases of a generation
+# a GenMethod given one fill it, without one nothing is measured
+#   timers: plan, freeze, buckets, league, allowed, pick, shuffle, draw
+#   counters: matches, picks, buckets_scanned, plan_checks, region_exhausted
+class GenStats:
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+
+    def Add(self, timer, seconds):
+        self.timers[timer] = self.timers.get(timer, 0.0) + seconds
+
+    def Count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    # sum the stats of another generation, like the cups of a batch
+    def Merge(self, other):
+        for timer, seconds in other.timers.items():
+            self.Add(timer, seconds)
+        for counter, n in other.counters.items():
+            self.Count(counter, n)
+
+    def exportAsJSONObject(self):
+        return {'timers': dict(self.timers), 'counters': dict(self.counters)}
+
+
+# candidates of one (region, seeder) pair, as ids of the CountryTable
+# pop() move the last country into the hole, so it is O(1)
+class CountryBucket:
+    def __init__(self, ids, region_id, seeder):
+        self.region_id = region_id
+        self.seeder = seeder
+        self.items = ids
+        # {id: index in items}, only built when asked, see Index
+        self.position = None
+
+    def __len__(self):
+        return len(self.items)
+
+    # index of the country id, or None if it is not in the bucket
+    def Index(self, cid):
+        if self.position is None:
+            self.position = {c: i for i, c in enumerate(self.items)}
+        return self.position.get(cid)
+
+    # remove the country at index i and return its id
+    def pop(self, i):
+        items = self.items
+        cid = items[i]
+        last = items.pop()
+        if i < len(items):
+            items[i] = last
+            if self.position is not None:
+                self.position[last] = i
+        if self.position is not None:
+            del self.position[cid]
+        return cid
+
 
 class GenMethod:
     # definition of rules
     #   rules['mins'][region] => minimum number of teams from region
     #   rules['max'][region] => maximum number of teams from region
     #   rules['SeedersOn'] = true/false, seeders enabled
+    #   rules['format'] => CupFormat, number and size of the groups
+    # nSeeders and nOthers are how many countries will be asked with
+    # GetSelections for seeder and non seeder slots. When given, the
+    # minimums are ensured and ValueError is raised if the rules can't be met
+    # rng is the random.Random used for every draw, so a run can be repeated
+    # progress(stage, done, total) is called while the league is played
+    # (stage 'league', done are matches) and after each pick ('picks'),
+    # it can raise an exception to stop the generation in the middle
+    # stats is a GenStats that receive the time and counters of each phase
+    # countries may be a list or a CountryTable, give the same table to many
+    # runs to build it once. The countries are never changed, each run keep
+    # its own scratch lists (like the league points) indexed by table id
 
-    def __init__(self, rules, countries, freezed):
+    def __init__(self, rules, countries, freezed, nSeeders=None, nOthers=None,
+                 rng=None, progress=None, stats=None):
         self.rules = rules
-        self.countries = countries.copy()
+        self.rng = rng if rng is not None else random.Random()
+        self.progress = progress
+        self.stats = stats
+        self.pool = AsCountryTable(countries)
+        self.countries = self.pool.countries
         self.freezed = freezed
 
-        self.region_slots = Counter()
-        for r in GetRegions():
-            self.region_slots[r] = self.rules['max'][r.id]
+        self.plan = None
+        # picks done and expected, the second is None if not told
+        self.picked = 0
+        self.n_picks = None
+        if nSeeders is not None or nOthers is not None:
+            self.n_picks = (nSeeders or 0) + (nOthers or 0)
+            if stats is not None:
+                start = perf_counter()
+            self.plan = QuotaPlan(rules, self.pool, freezed,
+                                  nSeeders or 0, nOthers or 0)
+            problem = self.plan.Problem()
+            if stats is not None:
+                stats.Add('plan', perf_counter() - start)
+            if problem:
+                raise ValueError(problem)
+            if not self.plan.NeedsChecks():
+                self.plan = None
+
+        # {region id: slots the region still can use}
+        self.region_slots = {r.id: RegionMax(rules, r.id, rules['format'].teams)
+                             for r in self.pool.regions}
+
+        # {region id: {seeder flag: CountryBucket}}, built on the first pick
+        # a region leaves the index when its slots are used up
+        self.buckets = None
+        # {isSeeder: [CountryBucket]}, reset when a bucket leaves the index
+        # and {isSeeder: countries in those buckets}, updated on each pick
+        self.allowed = {}
+        self.allowed_size = {}
+        # the other slots only take non seeders, see quota.SeedersApart
+        self.apart = SeedersApart(rules)
 
     def GetSelections(self, n, isSeeder=False):
-        selections = []
+        stats = self.stats
+        if self.buckets is None:
+            if stats is not None:
+                start = perf_counter()
+            self._buildBuckets()
+            if stats is not None:
+                stats.Add('buckets', perf_counter() - start)
 
-        # we should not append the freezed countries now
-        # only contabilize it so rules are safe
-        for c in self.freezed:
-            if c in self.countries:
-                self.countries.remove(c)
-                subCounter = {c.region: 1}
-                self.region_slots.subtract(subCounter)
-
-        n_countries_to_generate = range(n - len(selections))
-        for i in n_countries_to_generate:
-            if isSeeder:
-                allowedCountries = [
-                    c for c in self.countries
-                    if self.region_slots[c.region] > 0 and c.seeder
-                ]
-            else:
-                allowedCountries = [
-                    c for c in self.countries
-                    if self.region_slots[c.region] > 0
+        selections = []
+        for i in range(n):
+            if stats is not None:
+                start = perf_counter()
+            allowedBuckets = self.allowed.get(isSeeder)
+            if allowedBuckets is None:
+                allowedBuckets = [
+                    b for bySeeder in self.buckets.values()
+                    for seeder, b in bySeeder.items()
+                    if seeder == isSeeder or not (isSeeder or self.apart)
                 ]
+                self.allowed[isSeeder] = allowedBuckets
+                self.allowed_size[isSeeder] = sum(
+                    len(b.items) for b in allowedBuckets)
+            size = self.allowed_size[isSeeder]
 
-            pick = self._pickOne(allowedCountries)
-            selections.append(pick)
-            self.countries.remove(pick)
+            # only the buckets that keep the rules possible to complete
+            if self.plan is not None and not self.plan.AnyPickIsSafe():
+                if stats is not None:
+                    stats.Count('plan_checks', len(allowedBuckets))
+                allowedBuckets = [
+                    b for b in allowedBuckets
+                    if self.plan.CanTake(b.region_id, b.seeder, isSeeder)
+                ]
+                size = sum(len(b.items) for b in allowedBuckets)
 
-            # -1 slot for the country region
-            subCounter = {pick.region: 1}
-            self.region_slots.subtract(subCounter)
+            if stats is not None:
+                picking = perf_counter()
+                stats.Add('allowed', picking - start)
+                stats.Count('buckets_scanned', len(allowedBuckets))
+            bucket, index = self._pickOne(allowedBuckets, size)
+            if stats is not None:
+                stats.Add('pick', perf_counter() - picking)
+                stats.Count('picks')
+            selections.append(self.countries[self._take(bucket, index)])
+            if self.plan is not None:
+                self.plan.Take(bucket.region_id, bucket.seeder, isSeeder)
+            self.picked += 1
+            if self.progress is not None:
+                self.progress('picks', self.picked,
+                              self.n_picks or self.picked + n - 1 - i)
 
-        random.shuffle(selections)
+        if stats is not None:
+            start = perf_counter()
+        self.rng.shuffle(selections)
+        if stats is not None:
+            stats.Add('shuffle', perf_counter() - start)
         return selections
 
-    def _pickOne(self, countryList):
+    # receive the non empty buckets that can give the next country and
+    # how many countries they have together
+    # return (bucket, index of the country in bucket.items)
+    def _pickOne(self, buckets, size):
         pass
 
+    # order of the country ids inside a bucket, used by _pickOne
+    def _sortCandidates(self, ids):
+        return ids
+
+    def _buildBuckets(self):
+        slots = self.region_slots
+
+        # we should not append the freezed countries now
+        # only contabilize it so rules are safe
+        pool = self.pool
+        freezed = {}
+        if self.freezed:
+            if self.stats is not None:
+                start = perf_counter()
+            for c in self.freezed:
+                cid = pool.Index(c)
+                if cid is not None and cid not in freezed:
+                    freezed[cid] = (pool.region[cid], pool.seeder[cid])
+                    slots[c.region.id] -= 1
+            if self.stats is not None:
+                self.stats.Add('freeze', perf_counter() - start)
+
+        # the groups of the table are copied, not scanned
+        groups = []
+        for (code, seeder), ids in pool.Groups().items():
+            region_id = pool.regions[code].id
+            if slots[region_id] <= 0:
+                continue
+            ids = list(ids)
+            for cid, key in freezed.items():
+                if key == (code, seeder):
+                    ids.remove(cid)
+            if ids:
+                groups.append((ids[0], region_id, bool(seeder), ids))
+
+        # in the order of the first country of each bucket
+        self.buckets = {}
+        for first, region_id, seeder, ids in sorted(groups):
+            bucket = CountryBucket(self._sortCandidates(ids),
+                                   region_id, seeder)
+            self.buckets.setdefault(region_id, {})[seeder] = bucket
+
+    # remove the country at index i of the bucket, return its id
+    def _take(self, bucket, i):
+        cid = bucket.pop(i)
+        region_id = bucket.region_id
+        for isSeeder in self.allowed_size:
+            if bucket.seeder == isSeeder or not (isSeeder or self.apart):
+                self.allowed_size[isSeeder] -= 1
+        bySeeder = self.buckets[region_id]
+        if not bucket.items:
+            del bySeeder[bucket.seeder]
+            self.allowed.clear()
+            self.allowed_size.clear()
+
+        # -1 slot for the country region
+        self.region_slots[region_id] -= 1
+        if self.region_slots[region_id] <= 0 or not bySeeder:
+            del self.buckets[region_id]
+            self.allowed.clear()
+            self.allowed_size.clear()
+            if self.stats is not None:
+                self.stats.Count('region_exhausted')
+        return cid
+
+
 class SuperLeague(GenMethod):
-    def __init__( self, rules, countries, freezed ):
-        GenMethod.__init__(self, rules, countries, freezed)
+    def __init__(self, rules, countries, freezed, nSeeders=None, nOthers=None,
+                 rng=None, progress=None, stats=None):
+        GenMethod.__init__(self, rules, countries, freezed, nSeeders, nOthers,
+                           rng, progress, stats)
 
         # iterate on constructor so is safe to call _pickOne
-        self._doTheLeague()
+        if stats is not None:
+            start = perf_counter()
+        played = self._doTheLeague()
+        if stats is not None:
+            stats.Add('league', perf_counter() - start)
+            stats.Count('matches', played)
 
-    def _pickOne(self, countryList):
-        return max(countryList, key=operator.attrgetter('points'))
+    # buckets are sorted by points, the best of each one is the last
+    def _pickOne(self, buckets, size):
+        points = self.points
+        best = max(buckets, key=lambda b: points[b.items[-1]])
+        return best, len(best.items) - 1
+
+    def _sortCandidates(self, ids):
+        return sorted(ids, key=self.points.__getitem__)
 
     # there is no draw chance, win or lose
+    # self.points[id] get the points of each country
+    # return the number of matches played
     def _doTheLeague(self):
-        # here we create a new attribute inside the country object
-        # create/reset 'points'
-        for c in self.countries:
-            c.points = 0
+        n = len(self.pool)
+        points = self.points = [0] * n
 
-        matchs = combinations(self.countries, 2)
-        for m in matchs:
-            winner = self._getWinner(m[0], m[1])
-            winner.points += 3
+        # team i plays all the teams after it, same order of
+        # itertools.combinations, one progress call per row
+        played = 0
+        for team1 in range(n):
+            for team2 in range(team1 + 1, n):
+                points[self._getWinner(team1, team2)] += 3
+            played += n - 1 - team1
+            if self.progress is not None:
+                self.progress('league', played, n * (n - 1) // 2)
+        return played
 
+    # team1 and team2 are ids of the table
     def _getWinner(self, team1, team2):
-        total = team1.win_chance + team2.win_chance
-        r = random.uniform(0, total)
-        if r <= team1.win_chance:
+        chances = self.pool.win_chance
+        total = chances[team1] + chances[team2]
+        r = self.rng.uniform(0, total)
+        if r <= chances[team1]:
             return team1
         else:
             return team2
 
+# same league of SuperLeague, but played a row at time over plain lists
+# instead of one python call per match. For the same random state
+# the standings are the same of SuperLeague._doTheLeague
+class QuickLeague(SuperLeague):
+    def _doTheLeague(self):
+        chances = self.pool.win_chance.tolist()
+        points = [0] * len(chances)
+        rnd = self.rng.random
+
+        n = len(chances)
+        played = 0
+        for i in range(n - 1):
+            played += _playRows(chances, points, i, i + 1, rnd)
+            if self.progress is not None:
+                self.progress('league', played, n * (n - 1) // 2)
+
+        self.points = points
+        return played
+
+
+# the rows first to last - 1 of the league: team i plays all the teams
+# after it, the points are added to points. Return the matches played
+def _playRows(chances, points, first, last, rnd):
+    played = 0
+    # lost[j] is 3 when the team i+1+j beat the team i
+    for i in range(first, last):
+        wi = chances[i]
+        lost = [0 if rnd() * (wi + wj) <= wi else 3
+                for wj in chances[i + 1:]]
+        points[i] += 3 * len(lost) - sum(lost)
+        points[i + 1:] = map(add, points[i + 1:], lost)
+        played += len(lost)
+    return played
+
+
+# matches of a block of LeagueBlocks
+LEAGUE_BLOCK_MATCHES = 1 << 20
+# leagues with fewer matches are played in the calling process
+PARALLEL_MIN_MATCHES = 4 * LEAGUE_BLOCK_MATCHES
+
+
+# the rows of a league of n teams split in blocks of about 'matches'
+# matches, as [(first row, last row + 1)]. The blocks only depend on n
+def LeagueBlocks(n, matches=LEAGUE_BLOCK_MATCHES):
+    blocks = []
+    first = 0
+    played = 0
+    for i in range(n - 1):
+        played += n - 1 - i
+        if played >= matches:
+            blocks.append((first, i + 1))
+            first = i + 1
+            played = 0
+    if first < n - 1:
+        blocks.append((first, n - 1))
+    return blocks
+
+
+# the league of QuickLeague played in blocks of rows spread across worker
+# processes, for pools of many thousands of countries. The block b use the
+# stream b of a SeedSequence seeded from rng, so the standings are the
+# same for any number of workers, one included (the league is then played
+# in this process). The standings are not the ones of QuickLeague, that
+# play all the rows on the one stream of rng.
+# The workers get the win chances and add their points into one shared
+# memory block, the countries are never sent to them.
+# workers is the number of processes, default os.cpu_count()
+class ParallelLeague(SuperLeague):
+    def __init__(self, rules, countries, freezed, nSeeders=None, nOthers=None,
+                 rng=None, progress=None, stats=None, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        SuperLeague.__init__(self, rules, countries, freezed, nSeeders, nOthers,
+                             rng, progress, stats)
+
+    def _doTheLeague(self):
+        n = len(self.pool)
+        entropy = self.rng.getrandbits(64)
+        blocks = LeagueBlocks(n)
+        if self.workers == 1 or n * (n - 1) // 2 < PARALLEL_MIN_MATCHES:
+            self.points = self._playHere(blocks, entropy)
+        else:
+            self.points = self._playShared(blocks, entropy)
+        return n * (n - 1) // 2
+
+    def _playHere(self, blocks, entropy):
+        n = len(self.pool)
+        chances = self.pool.win_chance.tolist()
+        points = [0] * n
+        master = SeedSequence(entropy)
+        played = 0
+        for b, (first, last) in enumerate(blocks):
+            played += _playRows(chances, points, first, last,
+                                master.Child(b).Generator().random)
+            if self.progress is not None:
+                self.progress('league', played, n * (n - 1) // 2)
+        return points
+
+    # shared memory: the n win chances (double) then the n points (int64)
+    # the process modules are imported here, they double the import of gen
+    def _playShared(self, blocks, entropy):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        from multiprocessing.shared_memory import SharedMemory
+
+        n = len(self.pool)
+        shared = SharedMemory(create=True, size=16 * n)
+        try:
+            chances = shared.buf[:8 * n].cast('d')
+            chances[:] = array('d', self.pool.win_chance)
+            chances.release()
+            points = shared.buf[8 * n:16 * n].cast('q')
+            points[:] = array('q', bytes(8 * n))
+            points.release()
+
+            lock = multiprocessing.Lock()
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     initializer=_attachLeague,
+                                     initargs=(shared.name, n, lock)) as pool:
+                jobs = [pool.submit(_playLeagueBlock, first, last, entropy, b)
+                        for b, (first, last) in enumerate(blocks)]
+                try:
+                    played = 0
+                    for job in as_completed(jobs):
+                        played += job.result()
+                        if self.progress is not None:
+                            self.progress('league', played, n * (n - 1) // 2)
+                except BaseException:
+                    pool.shutdown(cancel_futures=True)
+                    raise
+
+            points = shared.buf[8 * n:16 * n].cast('q')
+            result = points.tolist()
+            points.release()
+            return result
+        finally:
+            shared.close()
+            shared.unlink()
+
+
+# state of a worker process of ParallelLeague, see _attachLeague
+_shared_league = {}
+
+
+# runs once in each worker process
+def _attachLeague(name, n, lock):
+    from multiprocessing.shared_memory import SharedMemory
+    shared = SharedMemory(name=name)
+    chances = shared.buf[:8 * n].cast('d')
+    _shared_league.update(shared=shared, n=n, lock=lock,
+                          chances=chances.tolist(),
+                          points=shared.buf[8 * n:16 * n].cast('q'))
+    chances.release()
+
+
+# runs in the worker process, play the block and add its points to the
+# shared ones. Return the matches played
+def _playLeagueBlock(first, last, entropy, block):
+    n = _shared_league['n']
+    points = [0] * n
+    rnd = SeedSequence(entropy).Child(block).Generator().random
+    played = _playRows(_shared_league['chances'], points, first, last, rnd)
+    shared_points = _shared_league['points']
+    with _shared_league['lock']:
+        shared_points[first:] = array(
+            'q', map(add, shared_points[first:], points[first:]))
+    return played
+
+
+# Elo rating points gained by a team that scored 1 more than expected
+ELO_K = 20
+# chance of a draw between two teams of the same rating, it shrinks as
+# the ratings drift apart
+ELO_DRAW = 0.28
+# win_chance given to the countries with 0, like WeightedRandom
+ELO_MIN_CHANCE = 0.01
+# points of the home and away teams by the score of the home team
+HOME_POINTS = {1.0: 3, 0.5: 1, 0.0: 0}
+AWAY_POINTS = {1.0: 0, 0.5: 1, 0.0: 3}
+
+
+# league with draws where the ratings change match by match, Elo style.
+# A team start with rating 400 * log10(win_chance), so the first matches
+# have the chances of SuperLeague: expected score w1 / (w1 + w2). A match
+# is won with chance E - m, drawn with 2m and lost with 1 - E - m, where E
+# is the expected score and m = ELO_DRAW * min(E, 1 - E), then both ratings
+# move ELO_K * (score - E). Win 3 points, draw 1.
+# Every team play every other one in n - 1 matchdays (circle method), a
+# team plays once per matchday so each matchday is computed at once over
+# lists of all its pairings, with no python call per match.
+# self.points[id] is (points, final rating), the rating break the ties
+class EloLeague(SuperLeague):
+    def _doTheLeague(self):
+        n = len(self.pool)
+        rnd = self.rng.random
+        # the ratings are kept in units of 400 points, so the expected
+        # score is 1 / (1 + 10 ** (other - own))
+        k = ELO_K / 400
+        draw = ELO_DRAW
+
+        # position p of the circle plays the position size - 1 - p, the
+        # position 0 stay and the others turn one place per matchday. With
+        # an odd n the position 0 is a rest, its match is skipped
+        odd = n % 2
+        size = n + odd
+        half = size // 2
+        first = odd
+        ids = [-1] * odd + list(range(n))
+        ratings = [0.0] * odd + [log10(w if w > 0 else ELO_MIN_CHANCE)
+                                 for w in self.pool.win_chance]
+        points = [0] * size
+
+        played = 0
+        total = n * (n - 1) // 2
+        tens = repeat(10.0)
+        for day in range(size - 1):
+            home = ratings[first:half]
+            away = ratings[half:size - first][::-1]
+            expected = [1 / (1 + q)
+                        for q in map(pow, tens, map(sub, away, home))]
+            # 1 win, 0.5 draw, 0 loss of the home team, the draws are the
+            # random numbers near the expected score
+            score = [0.5 if abs(r - e) < draw * (0.5 - abs(e - 0.5)) else
+                     1.0 if r < e else 0.0
+                     for e, r in zip(expected, [rnd() for e in expected])]
+            change = [k * (s - e) for s, e in zip(score, expected)]
+            ratings[first:half] = map(add, home, change)
+            ratings[half:size - first] = list(map(sub, away, change))[::-1]
+            # the points of the positions first to size - first, in order
+            points[first:size - first] = map(
+                add, points[first:size - first],
+                [HOME_POINTS[s] for s in score] +
+                [AWAY_POINTS[s] for s in reversed(score)])
+
+            # turn all the positions but the first
+            for column in (ids, ratings, points):
+                column[1:] = column[-1:] + column[1:-1]
+            played += half - first
+            if self.progress is not None:
+                self.progress('league', played, total)
+
+        standings = [None] * n
+        for cid, p, rating in zip(ids, points, ratings):
+            if cid >= 0:
+                standings[cid] = (p, 400 * rating)
+        self.points = standings
+        return played
+
+
+# pairwise results of a league, kept between runs so only the matches
+# of added, removed or changed countries are played again, O(n) per country
+class LeagueTable:
+    def __init__(self):
+        # {country: win_chance when its matches were played}
+        self.chances = {}
+        # {country: set of countries it beat}
+        self.wins = {}
+        # {country: points}
+        self.points = {}
+        # matches played by the last Update
+        self.played = 0
+
+    # bring the table up to date with countries, return the points
+    # progress(stage, done, total) as in GenMethod, after each new country
+    def Update(self, countries, rng, progress=None):
+        current = set(countries)
+        for c in [c for c in self.chances if c not in current]:
+            self._remove(c)
+
+        stale = [c for c in countries
+                 if c not in self.chances or self.chances[c] != c.win_chance]
+        for c in stale:
+            if c in self.chances:
+                self._remove(c)
+
+        # each new country plays all the ones already in the table
+        played = 0
+        base = len(self.chances)
+        total = len(stale) * base + len(stale) * (len(stale) - 1) // 2
+        for c in stale:
+            played += len(self.chances)
+            self._add(c, rng)
+            if progress is not None:
+                progress('league', played, total)
+        self.played = played
+        return self.points
+
+    def _remove(self, country):
+        del self.wins[country]
+        del self.points[country]
+        del self.chances[country]
+        for other, beaten in self.wins.items():
+            if country in beaten:
+                beaten.discard(country)
+                self.points[other] -= 3
+
+    # same model of SuperLeague._getWinner
+    def _add(self, country, rng):
+        rnd = rng.random
+        wc = country.win_chance
+        beaten = set()
+        points = 0
+        for other in self.chances:
+            if rnd() * (wc + other.win_chance) <= wc:
+                beaten.add(other)
+                points += 3
+            else:
+                self.wins[other].add(country)
+                self.points[other] += 3
+        self.wins[country] = beaten
+        self.points[country] = points
+        self.chances[country] = wc
+
+
+# SuperLeague that keep the match results in a LeagueTable between runs
+# (like between two Generate clicks), after the first run only the edited
+# countries play again. The cup depends on the table, so the seed alone
+# doesn't generate it again
+class IncrementalLeague(SuperLeague):
+    def __init__(self, rules, countries, freezed, nSeeders=None, nOthers=None,
+                 rng=None, progress=None, stats=None, table=None):
+        self.table = table if table is not None else LeagueTable()
+        SuperLeague.__init__(self, rules, countries, freezed, nSeeders, nOthers,
+                             rng, progress, stats)
+
+    def _doTheLeague(self):
+        points = self.table.Update(self.countries, self.rng, self.progress)
+        self.points = [points[c] for c in self.countries]
+        return self.table.played
+
+
 class AllRandom(GenMethod):
-    def _pickOne(self, countryList):
-        return random.choice(countryList)
+    # same as a random.choice over all the allowed countries
+    def _pickOne(self, buckets, size):
+        r = self.rng.randrange(size)
+        for b in buckets:
+            n = len(b.items)
+            if r < n:
+                return b, r
+            r -= n
+
+
+
+# Vose alias method: after the O(n) setup, draw an index
+# with chance proportional to its weight in O(1)
+class AliasTable:
+    def __init__(self, weights):
+        n = len(weights)
+        total = sum(weights)
+        self.prob = [w * n / total for w in weights]
+        self.alias = list(range(n))
+
+        small = [i for i, p in enumerate(self.prob) if p < 1]
+        large = [i for i, p in enumerate(self.prob) if p >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.alias[s] = l
+            self.prob[l] += self.prob[s] - 1
+            if self.prob[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+        # leftovers are 1 except by rounding errors
+        for i in small + large:
+            self.prob[i] = 1
+
+    def draw(self, rnd):
+        i = int(rnd() * len(self.prob))
+        if rnd() < self.prob[i]:
+            return i
+        return self.alias[i]
+
+
+# pick countries with chance proportional to win_chance
+class WeightedRandom(GenMethod):
+    def __init__(self, rules, countries, freezed, nSeeders=None, nOthers=None,
+                 rng=None, progress=None, stats=None):
+        GenMethod.__init__(self, rules, countries, freezed, nSeeders, nOthers,
+                           rng, progress, stats)
+        # {bucket: [alias table, ids of the table, total weight]}
+        self.tables = {}
+        # {bucket: sum of the weights still in the bucket}
+        self.live = {}
+
+    def _weight(self, cid):
+        # a zero chance country would never be picked, even if the
+        # rules need it, so keep a small chance for it
+        chance = self.pool.win_chance[cid]
+        return chance if chance > 0 else 0.01
+
+    def _pickOne(self, buckets, size):
+        live = [self._liveWeight(b) for b in buckets]
+        r = self.rng.random() * sum(live)
+        for b, w in zip(buckets, live):
+            if r < w:
+                break
+            r -= w
+        return self._drawFromBucket(b)
+
+    def _liveWeight(self, bucket):
+        if bucket not in self.live:
+            self._buildTable(bucket)
+        return self.live[bucket]
+
+    # the table is kept while the bucket lose countries, removed ones
+    # are drawn again, and it is rebuilt when half of the weight is gone
+    def _drawFromBucket(self, bucket):
+        table, ids, total = self.tables[bucket]
+        if self.live[bucket] * 2 < total:
+            self._buildTable(bucket)
+            table, ids, total = self.tables[bucket]
+
+        rnd = self.rng.random
+        while True:
+            index = bucket.Index(ids[table.draw(rnd)])
+            if index is not None:
+                return bucket, index
+
+    def _buildTable(self, bucket):
+        ids = list(bucket.items)
+        weights = [self._weight(cid) for cid in ids]
+        self.tables[bucket] = [AliasTable(weights), ids, sum(weights)]
+        self.live[bucket] = sum(weights)
+
+    def _take(self, bucket, i):
+        if bucket in self.live:
+            self.live[bucket] -= self._weight(bucket.items[i])
+        return GenMethod._take(self, bucket, i)
+
+# split the slots not freezed in (seeder slots, other slots)
+def NeededSlots(rules, freezed):
+    fmt = rules['format']
+    empty = [i for i in range(fmt.teams) if i not in freezed]
+    if not rules['SeedersOn']:
+        return [], empty
+    # fmt.IsSeederSlot, once per slot
+    size = fmt.group_size
+    seeded = fmt.seeded
+    seeders = []
+    others = []
+    for i in empty:
+        (seeders if i % size < seeded else others).append(i)
+    return seeders, others
+
+
+# generate a full world cup and return the list of slots (one country each)
+# the slot i is the position i % group_size of the group i // group_size
+# of rules['format'], the first positions of each group are the seeder ones
+# freezed is a dict {slot: country} of slots that keep their country
+# with rules['SeparateRegions'] the groups are drawn by DrawGroups
+# raise ValueError if the rules can't be met
+# progress and stats are given to the method, see GenMethod, and progress
+# to the draw
+def GenerateCup(method_class, rules, countries, freezed=None, rng=None,
+                progress=None, stats=None):
+    freezed = freezed or {}
+    slots = [freezed.get(i) for i in range(rules['format'].teams)]
+
+    needed_seeders, needed_non_seeders = NeededSlots(rules, freezed)
+    method = method_class(rules, countries, list(freezed.values()),
+                          len(needed_seeders), len(needed_non_seeders), rng,
+                          progress=progress, stats=stats)
+    picks = (method.GetSelections(len(needed_seeders), isSeeder=True) +
+             method.GetSelections(len(needed_non_seeders)))
+
+    for i, c in zip(needed_seeders + needed_non_seeders, picks):
+        slots[i] = c
+    if rules.get('SeparateRegions'):
+        if stats is not None:
+            start = perf_counter()
+        slots = DrawGroups(rules, slots, freezed, method.rng, progress)
+        if stats is not None:
+            stats.Add('draw', perf_counter() - start)
+    return slots
@@ -2,15 +2,34 @@
 
 import sys
 import os
+import random
+import sqlite3
+from time import perf_counter
+from functools import partial
 import wx
-from data import GetRegions
-from gen import SuperLeague, AllRandom
+from gen import SuperLeague, QuickLeague, AllRandom, WeightedRandom
+from gen import IncrementalLeague, LeagueTable, DefaultRules, GenStats
+from gen import EloLeague
+from gen import GenerateCup
+from data import RegionCounts
 from ruleseditor import RulesEditor
 from countryeditor import CountryEditor
+from worker import Worker
+from history import History
+
+# steps of the generation progress bar
+PROGRESS_RANGE = 1000
+
+# every generated cup is stored here, see history.py
+HISTORY_FILE = os.path.join(os.path.expanduser('~'), '.wcg_history.db')
+
+# name of each method of the combo in the history, like wcg-batch
+METHOD_NAMES = ['random', 'league', 'quickleague', 'weighted', 'incremental',
+                'elo']
 
 
 class MainFrame(wx.Frame):
-    def __init__(self):
+    def __init__(self, history_file=HISTORY_FILE):
         wx.Frame.__init__(self, None,
                           id=wx.ID_ANY,
                           title=_("World Cup Generator"),
@@ -22,19 +41,32 @@ class MainFrame(wx.Frame):
         self.slots_seeders = []
         self.slots_non_seeders = []
         self.countries = []
+        # countries and seeders per region, from the CountryEditor
+        self.region_counts = RegionCounts()
         # countries in this list not change when generating a new world cup
         self.countries_freezed = []
+        # league results kept between generations, see IncrementalLeague
+        self.league_table = LeagueTable()
+
+        # setup rules / default
+        self.rules = DefaultRules()
+
+        # generation running in background, see onGenerate
+        self.worker = None
+
+        # without a history file the cups are only shown
+        # (method, freezed slots) and the setup id of the last stored cup,
+        # reset when the rules or the countries change
+        self.history_setup = None
+        try:
+            self.history = History(history_file, batch_size=1)
+        except sqlite3.Error:
+            self.history = None
 
         self.gui_init()
         self.setup_icon()
         self.SetMinSize(self.GetSize())
         self._UpdateGUI()
-
-        # setup rules / default
-        self.rules = {'SeedersOn': True, 'mins': {}, 'max': {}}
-        for r in GetRegions():
-            self.rules['mins'][r.id] = 0
-            self.rules['max'][r.id] = 32
         self.cmb_method.SetSelection(1)
 
 
@@ -50,77 +82,151 @@ class MainFrame(wx.Frame):
                 self.countries_freezed.remove(btn.wcg_country)
         return
 
+    # the generation run on a worker thread, while it runs the same
+    # button cancel it
     def onGenerate(self, event):
-        if len(self.countries) < 32:
-            wx.MessageBox(_("Need at least 32 countries"
-                            " to make a World Cup."),
+        if self.worker is not None:
+            self.worker.Cancel()
+            return
+
+        teams = self.rules['format'].teams
+        if len(self.countries) < teams:
+            wx.MessageBox(_("Need at least {n} countries"
+                            " to make a World Cup.").format(n=teams),
                           _("Fail to Generate"),
                           wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
             return
 
-        # check if we have enought seeders considering the rules
-        # example: one region have 15 seeders while others have 0,
-        #          if this region have a rule-limit of 7 teams,
-        #          we will be missing 1 seeder
-        if self.rules['SeedersOn']:
-            seeders = [c for c in self.countries if c.seeder]
-            if len(seeders) < 8:
-                wx.MessageBox(_("Need at least 8 seeders."),
-                              _("Impossible create a World Cup"),
-                              wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
+        # slot.GetValue() tell if freezed
+        freezed = {i: s.wcg_country for i, s in enumerate(self.slots)
+                   if s.GetValue()}
+
+        # the method check if the rules (minimums, maximums and seeders)
+        # can be met with the freezed countries before picking anything,
+        # GenerateCup fill the other slots and draw the groups if the
+        # regions are separated
+        cup_generator = {0: AllRandom, 1: SuperLeague, 2: QuickLeague,
+                         3: WeightedRandom,
+                         4: partial(IncrementalLeague,
+                                    table=self.league_table),
+                         5: EloLeague}
+        method_class = cup_generator[self.cmb_method.GetSelection()]
+        method_name = METHOD_NAMES[self.cmb_method.GetSelection()]
+        rules = self.rules
+        countries = list(self.countries)
+        # stored with the cup, the same seed generate it again (but for
+        # the incremental league, that also depends on the earlier runs)
+        seed = random.getrandbits(64)
+
+        # runs on the worker thread, only touch the copies above
+        def job(progress):
+            stats = GenStats()
+            start = perf_counter()
+            cup = GenerateCup(method_class, rules, countries, freezed,
+                              random.Random(seed), progress=progress,
+                              stats=stats)
+            stats.Add('total', perf_counter() - start)
+            return cup, stats
+
+        def later(method):
+            return lambda *args: wx.CallAfter(method, worker, *args)
+
+        def onDone(worker, result, error):
+            if not self._endGeneration(worker, error):
                 return
-
-            max_possible_seeders = sum(
-                min(len([c for c in seeders if c.region == r]),
-                    self.rules['max'][r.id])
-                for r in GetRegions())
-
-            if max_possible_seeders < 8:
-                wx.MessageBox(
-                    _("The minimun per region"
-                      " do not ensure 8 seeders available."),
-                    _("Impossíble create a World Cup"),
-                    wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
-                return
-
-        cup_generator = {0: AllRandom, 1: SuperLeague}
-        selection = self.cmb_method.GetSelection()
-        method = cup_generator[selection](self.rules,
-                                          self.countries,
-                                          self.countries_freezed)
-
-        # slot.GetValue)() tell if freezed
-        if self.rules['SeedersOn']:
-            needed_seeders = [
-                s for s in self.slots_seeders
-                if not s.GetValue()]
-            needed_non_seeders = [
-                s for s in self.slots_non_seeders
-                if not s.GetValue()]
-            seeder_choices = method.GetSelections(len(needed_seeders),
-                                                  isSeeder=True)
-            country_choices = method.GetSelections(len(needed_non_seeders))
-
-            for slot in needed_seeders:
-                c = seeder_choices.pop(0)
-                slot.SetLabel(c.name)
-                slot.wcg_country = c
-            for slot in needed_non_seeders:
-                c = country_choices.pop(0)
-                slot.SetLabel(c.name)
-                slot.wcg_country = c
+            cup, stats = result
+            self.SetStatusText(self._statsText(stats))
+            for i, (slot, c) in enumerate(zip(self.slots, cup)):
+                if i not in freezed:
+                    slot.SetLabel(c.name)
+                    slot.wcg_country = c
+            self._storeCup(cup, rules, method_name, freezed, seed)
+
+        worker = Worker(job, later(self._onGenerateProgress), later(onDone))
+        self.worker = worker
+        self._setGenerating(True)
+        worker.start()
+
+    # one line about where the time of the last generation went
+    def _statsText(self, stats):
+        timers = stats.timers
+        counters = stats.counters
+        text = _("Generated in {total:.3f} s").format(
+            total=timers.get('total', 0.0))
+        if 'league' in timers:
+            text += _(", league {league:.3f} s ({matches} matches)").format(
+                league=timers['league'], matches=counters.get('matches', 0))
+        text += _(", {picks} picks in {pick:.3f} s").format(
+            picks=counters.get('picks', 0),
+            pick=timers.get('allowed', 0.0) + timers.get('pick', 0.0))
+        return text
+
+    def _onGenerateProgress(self, worker, stage, done, total):
+        if not self or worker is not self.worker:
+            return
+        if stage == 'league':
+            text = _("Matches played: {done}/{total}")
+        elif stage == 'draw':
+            text = _("Drawing the groups: {done}/{total}")
         else:
-            needed_slots = [s for s in self.slots if not s.GetValue()]
-            choices = method.GetSelections(len(needed_slots))
-            for slot in needed_slots:
-                c = choices.pop(0)
-                slot.SetLabel(c.name)
-                slot.wcg_country = c
+            text = _("Picks done: {done}/{total}")
+        self.lbl_progress.SetLabel(text.format(done=done, total=total))
+        self.gauge.SetValue(PROGRESS_RANGE * done // max(1, total))
+
+    # back to the idle state, return True if the generation has a result
+    def _endGeneration(self, worker, error):
+        if not self or worker is not self.worker:
+            return False
+        self.worker = None
+        self._setGenerating(False)
+        self.gauge.SetValue(0)
+        if error is False:
+            self.lbl_progress.SetLabel(_("Cancelled"))
+            return False
+        self.lbl_progress.SetLabel(wx.EmptyString)
+        if error:
+            wx.MessageBox(error,
+                          _("Impossible create a World Cup"),
+                          wx.ICON_EXCLAMATION | wx.STAY_ON_TOP)
+            return False
+        return True
+
+    # the countries, rules and slots stay the same while generating
+    def _setGenerating(self, running):
+        self.btn_generate.SetLabel(_("Cancel") if running else _("Generate"))
+        for widget in [self.cmb_method, self.btn_countries,
+                       self.btn_rules] + self.slots:
+            widget.Enable(not running)
+
+    def _storeCup(self, cup, rules, method_name, freezed, seed):
+        if self.history is None:
+            return
+        key = (method_name, sorted(freezed.items()))
+        try:
+            if self.history_setup is None or self.history_setup[0] != key:
+                setup = self.history.Setup(method_name, rules, freezed,
+                                           self.countries)
+                self.history_setup = (key, setup)
+            self.history.Add(self.history_setup[1], cup, seed)
+        except (sqlite3.Error, OSError) as e:
+            self.SetStatusText(_("History not saved: {error}").format(
+                error=e))
+
+    def onClose(self, event):
+        if self.worker is not None:
+            self.worker.Cancel()
+            self.worker = None
+        if self.history is not None:
+            self.history.Close()
+            self.history = None
+        event.Skip()
 
     def onCallCountryManager(self, event):
         ce = CountryEditor(self, self.countries)
         if ce.ShowModal() == wx.ID_OK:
-            self.countries = ce.getCountriesList()
+            self.countries = ce.applyChanges()
+            self.region_counts = ce.getRegionCounts()
+            self.history_setup = None
 
             # check if an old selected country is now removed
             for btn in self.slots:
@@ -133,14 +239,20 @@ class MainFrame(wx.Frame):
             self._UpdateGUI()
 
     def onCallRulesManager(self, event):
-        re = RulesEditor(self, self.rules, self.countries)
+        old_format = self.rules['format']
+        re = RulesEditor(self, self.rules, self.region_counts,
+                         self.countries)
         if re.ShowModal() == wx.ID_OK:
             self.rules = re.GetRules()
+            self.history_setup = None
+            if self.rules['format'] != old_format:
+                self._buildGroups()
+                self._UpdateGUI()
 
     # enable/disable buttons
     # should run when program starts and after country editor
     def _UpdateGUI(self):
-        if len(self.countries) >= 32:
+        if len(self.countries) >= self.rules['format'].teams:
             self.btn_rules.Enable()
             self.btn_generate.Enable()
         else:
@@ -155,44 +267,70 @@ class MainFrame(wx.Frame):
         icon_name = start_path + "/icons/app.svg"
         self.SetIcon(wx.Icon(icon_name, wx.BITMAP_TYPE_ICO))
 
-    def gui_init(self):
+    # (re)create one box of slots per group of the cup format
+    # the freezed countries are lost, as the slots don't exist anymore
+    def _buildGroups(self):
         text_group = _("Group ")
-        text_generate = _("Generate")
-        text_cmb = _("Combo")
-        text_country = _("Country Editor")
-        text_rule = _("Rules Editor")
-        method_choices = [_("All Random"), _("Super League")]
+        fmt = self.rules['format']
 
-        self.SetSizeHints(wx.Size(-1, -1), wx.DefaultSize)
-
-        pnl_main = wx.Panel(self, wx.ID_ANY,
-                            wx.DefaultPosition, wx.DefaultSize,
-                            wx.TAB_TRAVERSAL)
+        for widget in self.group_widgets:
+            widget.Destroy()
+        self.sizer_grid.Clear()
+        self.group_widgets = []
+        self.slots = []
+        self.slots_seeders = []
+        self.slots_non_seeders = []
+        self.countries_freezed = []
 
-        sizer_grid = wx.GridSizer(2, 4, 0, 0)
-        for group in 'ABCDEFGH':
+        for group in fmt.GroupNames():
             sizer_group = wx.BoxSizer(wx.VERTICAL)
-            lbl_group = wx.StaticText(pnl_main, wx.ID_ANY,
+            lbl_group = wx.StaticText(self.pnl_main, wx.ID_ANY,
                                       text_group + group,
                                       wx.DefaultPosition, wx.DefaultSize, 0)
             lbl_group.Wrap(-1)
             sizer_group.Add(lbl_group, 0, wx.ALIGN_CENTER_HORIZONTAL | wx.ALL, 5)
-            for i in range(0, 4):
-                btn_team = wx.ToggleButton(pnl_main, wx.ID_ANY,
+            self.group_widgets.append(lbl_group)
+            for i in range(0, fmt.group_size):
+                btn_team = wx.ToggleButton(self.pnl_main, wx.ID_ANY,
                                            wx.EmptyString,
                                            wx.DefaultPosition,
                                            wx.DefaultSize, 0)
                 sizer_group.Add(btn_team, 0, wx.ALL | wx.EXPAND, 5)
+                self.group_widgets.append(btn_team)
 
                 self.slots.append(btn_team)
-                if i == 0:
+                if fmt.IsSeederSlot(i):
                     self.slots_seeders.append(btn_team)
                 else:
                     self.slots_non_seeders.append(btn_team)
                 btn_team.Bind(wx.EVT_TOGGLEBUTTON, self.onClickFreeze)
                 btn_team.wcg_country = None
-            sizer_grid.Add(sizer_group, 1, wx.EXPAND, 5)
+            self.sizer_grid.Add(sizer_group, 1, wx.EXPAND, 5)
+
+        self.pnl_main.Layout()
+        self.Layout()
+
+    def gui_init(self):
+        text_generate = _("Generate")
+        text_cmb = _("Combo")
+        text_country = _("Country Editor")
+        text_rule = _("Rules Editor")
+        method_choices = [_("All Random"), _("Super League"),
+                          _("Quick League"), _("Weighted Random"),
+                          _("Super League (keep results)"),
+                          _("Elo League (with draws)")]
+
+        self.SetSizeHints(wx.Size(-1, -1), wx.DefaultSize)
+
+        pnl_main = wx.Panel(self, wx.ID_ANY,
+                            wx.DefaultPosition, wx.DefaultSize,
+                            wx.TAB_TRAVERSAL)
 
+        # the groups are filled by _buildGroups
+        self.sizer_grid = wx.GridSizer(0, 4, 0, 0)
+        self.pnl_main = pnl_main
+        self.group_widgets = []
+        self._buildGroups()
 
         self.btn_generate = wx.Button(pnl_main, wx.ID_ANY,
                                       text_generate,
@@ -208,6 +346,13 @@ class MainFrame(wx.Frame):
         self.btn_rules = wx.Button(pnl_main, wx.ID_ANY,
                                    text_rule,
                                    wx.DefaultPosition, wx.DefaultSize, 0)
+        self.gauge = wx.Gauge(pnl_main, wx.ID_ANY, PROGRESS_RANGE,
+                              wx.DefaultPosition, wx.DefaultSize,
+                              wx.GA_HORIZONTAL)
+        self.lbl_progress = wx.StaticText(pnl_main, wx.ID_ANY,
+                                          wx.EmptyString,
+                                          wx.DefaultPosition, wx.DefaultSize,
+                                          wx.ST_NO_AUTORESIZE)
         staticline = wx.StaticLine(pnl_main, wx.ID_ANY,
                                    wx.DefaultPosition, wx.DefaultSize,
                                    wx.LI_HORIZONTAL)
@@ -215,12 +360,14 @@ class MainFrame(wx.Frame):
         sizer_cmd = wx.BoxSizer(wx.VERTICAL)
         sizer_cmd.Add(self.btn_generate, 0, wx.ALL | wx.EXPAND, 5)
         sizer_cmd.Add(self.cmb_method, 0, wx.ALL | wx.EXPAND, 5)
+        sizer_cmd.Add(self.gauge, 0, wx.ALL | wx.EXPAND, 5)
+        sizer_cmd.Add(self.lbl_progress, 0, wx.ALL | wx.EXPAND, 5)
         sizer_cmd.Add(staticline, 0, wx.EXPAND | wx.ALL, 5)
         sizer_cmd.Add(self.btn_countries, 0, wx.ALL | wx.EXPAND, 5)
         sizer_cmd.Add(self.btn_rules, 0, wx.ALL | wx.EXPAND, 5)
 
         sizer_top = wx.BoxSizer(wx.HORIZONTAL)
-        sizer_top.Add(sizer_grid, 1, wx.EXPAND, 5)
+        sizer_top.Add(self.sizer_grid, 1, wx.EXPAND, 5)
         sizer_top.Add(sizer_cmd, 0, wx.EXPAND, 5)
 
         pnl_main.SetSizer(sizer_top)
@@ -230,10 +377,13 @@ class MainFrame(wx.Frame):
         sizer_main = wx.BoxSizer(wx.VERTICAL)
         sizer_main.Add(pnl_main, 1, wx.EXPAND | wx.ALL, 5)
         self.SetSizer(sizer_main)
+        # time and counters of the last generation
+        self.CreateStatusBar()
         self.Layout()
         self.Centre(wx.BOTH)
 
         self.btn_generate.Bind(wx.EVT_BUTTON, self.onGenerate)
         self.btn_countries.Bind(wx.EVT_BUTTON, self.onCallCountryManager)
         self.btn_rules.Bind(wx.EVT_BUTTON, self.onCallRulesManager)
+        self.Bind(wx.EVT_CLOSE, self.onClose)
 
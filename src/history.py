@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# History of the generated cups in a SQLite file: every cup with its
+# method, rules, freezed slots and seed, and where each country landed.
+#   ./history.py history.db                    cups and countries stored
+#   ./history.py history.db --drawn Brasil     cups with Brasil
+#   ./history.py history.db --together Brasil Alemanha
+#                                              cups with both in one group
+#
+# Tables:
+#   setups     (id, method, rules, freezed), a batch run store its setup once
+#   cups       (id, setup, seed, created, teams), teams are the country ids
+#              of the slots, as uint32. The seed generate the cup again
+#              with its setup, except for the 'incremental' method, whose
+#              league keep the results of the runs before it
+#   countries  (id, name, number), number tell apart the countries of the
+#              same name (the editor allow them): the first of the pool
+#              is 0, the next 1...
+#   slots      (country, cup, slot, grp), one row per team of a cup
+# slots is stored in the order of its key (country, cup, slot), with no
+# other index to update: the cups of a country are a range of the table,
+# and two countries in one group a lookup of the other country per cup.
+#
+# The file use WAL, so the GUI and a batch run can use it at the same time
+# and readers don't wait for the writers. Add keep the cups in memory and
+# write them BATCH_SIZE at time, each batch in one transaction.
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from array import array
+from datetime import datetime, timezone
+
+BATCH_SIZE = 1000
+# pages kept in memory, in KiB, the insert touch one page per country
+CACHE_KIB = 65536
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS setups (
+    id INTEGER PRIMARY KEY,
+    method TEXT NOT NULL,
+    rules TEXT NOT NULL,
+    freezed TEXT NOT NULL,
+    UNIQUE (method, rules, freezed));
+CREATE TABLE IF NOT EXISTS cups (
+    id INTEGER PRIMARY KEY,
+    setup INTEGER NOT NULL REFERENCES setups (id),
+    seed TEXT,
+    created TEXT NOT NULL,
+    teams BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS countries (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    UNIQUE (name, number));
+CREATE TABLE IF NOT EXISTS slots (
+    country INTEGER NOT NULL,
+    cup INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    grp INTEGER NOT NULL,
+    PRIMARY KEY (country, cup, slot)) WITHOUT ROWID;
+"""
+
+
+# the rules dict of gen.DefaultRules as JSON values
+def ExportRules(rules):
+    data = dict(rules)
+    data['format'] = rules['format'].exportAsJSONObject()
+    return data
+
+
+class History:
+    def __init__(self, file_name, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        # the transactions are opened by hand, see Flush
+        self.db = sqlite3.connect(file_name, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # a crash may lose the last batches, never corrupt the file
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA cache_size=-{kib}".format(kib=CACHE_KIB))
+        self.db.executescript(_SCHEMA)
+
+        # {Country: id}, by object so two countries of the same name don't
+        # become one, filled on use
+        self.country_ids = {}
+        # {Country: number} of the pools given to Setup, and {name: last
+        # number given} to the countries of no pool
+        self.numbers = {}
+        self.last_numbers = {}
+        # {setup id: group size}
+        self.group_sizes = {}
+        # cups not written yet
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+    def Close(self):
+        if self.db is None:
+            return
+        self.Flush()
+        self.db.close()
+        self.db = None
+
+    # id of the setup of some cups: the method name, the rules and the
+    # freezed slots {slot: country}. A batch run ask it once
+    # countries is the pool, in its order they get their numbers
+    def Setup(self, method, rules, freezed=None, countries=()):
+        seen = {}
+        for c in countries:
+            self.numbers[c] = seen.get(c.name, 0)
+            seen[c.name] = self.numbers[c] + 1
+        setup = (method,
+                 json.dumps(ExportRules(rules), sort_keys=True),
+                 json.dumps({str(i): c.name
+                             for i, c in sorted((freezed or {}).items())},
+                            ensure_ascii=False))
+        self.db.execute("INSERT OR IGNORE INTO setups"
+                        " (method, rules, freezed) VALUES (?, ?, ?)", setup)
+        setup_id = self.db.execute(
+            "SELECT id FROM setups WHERE method = ? AND rules = ?"
+            " AND freezed = ?", setup).fetchone()[0]
+        self.group_sizes[setup_id] = rules['format'].group_size
+        return setup_id
+
+    # store a generated cup, slots is the list of gen.GenerateCup. The cup
+    # is written with the next batch, Flush write it now
+    def Add(self, setup_id, slots, seed=None):
+        self.pending.append((setup_id, None if seed is None else str(seed),
+                             list(slots)))
+        if len(self.pending) >= self.batch_size:
+            self.Flush()
+
+    def Flush(self):
+        if not self.pending:
+            return
+        pending = self.pending
+        self.pending = []
+        created = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+        db = self.db
+        # the ids of the cups are given here, other writers wait
+        try:
+            db.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            # not written, they go with the next Flush
+            self.pending = pending + self.pending
+            raise
+        try:
+            ids = self.country_ids
+            for setup_id, seed, slots in pending:
+                for c in slots:
+                    if c not in ids:
+                        ids[c] = self._countryId(c)
+
+            cup_id = db.execute("SELECT coalesce(max(id), 0) FROM cups"
+                                ).fetchone()[0]
+            cups = []
+            rows = []
+            for setup_id, seed, slots in pending:
+                cup_id += 1
+                size = self.group_sizes[setup_id]
+                teams = [ids[c] for c in slots]
+                cups.append((cup_id, setup_id, seed, created,
+                             array('I', teams).tobytes()))
+                rows.extend([(country_id, cup_id, i, i // size)
+                             for i, country_id in enumerate(teams)])
+            db.executemany("INSERT INTO cups VALUES (?, ?, ?, ?, ?)", cups)
+            db.executemany("INSERT INTO slots VALUES (?, ?, ?, ?)", rows)
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            # the countries added in this transaction are gone too
+            self.country_ids = {}
+            self.last_numbers = {}
+            self.pending = pending + self.pending
+            raise
+
+    def _countryId(self, country):
+        number = self.numbers.get(country)
+        if number is None:
+            number = self.last_numbers.get(country.name, -1) + 1
+            self.last_numbers[country.name] = number
+        key = (country.name, number)
+        self.db.execute("INSERT OR IGNORE INTO countries (name, number)"
+                        " VALUES (?, ?)", key)
+        return self.db.execute("SELECT id FROM countries"
+                               " WHERE name = ? AND number = ?",
+                               key).fetchone()[0]
+
+    # queries, the cups not flushed yet are not seen. A name ask for all
+    # the countries of that name
+
+    def Cups(self):
+        return self.db.execute("SELECT count(*) FROM cups").fetchone()[0]
+
+    # names of the slots of the cup
+    def Cup(self, cup_id):
+        row = self.db.execute("SELECT teams FROM cups WHERE id = ?",
+                              (cup_id,)).fetchone()
+        if row is None:
+            return None
+        teams = array('I')
+        teams.frombytes(row[0])
+        names = dict(self.db.execute("SELECT id, name FROM countries"))
+        return [names[country_id] for country_id in teams]
+
+    # cups with the country, only in the group grp (0 is A) if given
+    def Drawn(self, name, grp=None):
+        if grp is None:
+            return self.db.execute(
+                "SELECT count(DISTINCT cup) FROM slots WHERE country IN"
+                " (SELECT id FROM countries WHERE name = ?)",
+                (name,)).fetchone()[0]
+        return self.db.execute(
+            "SELECT count(DISTINCT cup) FROM slots WHERE country IN"
+            " (SELECT id FROM countries WHERE name = ?) AND grp = ?",
+            (name, grp)).fetchone()[0]
+
+    # cups with both countries in the same group, two countries of the
+    # same name if name is other
+    def Together(self, name, other):
+        return self.db.execute(
+            "SELECT count(DISTINCT a.cup) FROM slots AS a JOIN slots AS b"
+            " ON b.cup = a.cup AND b.grp = a.grp AND b.country != a.country"
+            " AND b.country IN (SELECT id FROM countries WHERE name = ?)"
+            " WHERE a.country IN (SELECT id FROM countries WHERE name = ?)",
+            (other, name)).fetchone()[0]
+
+    # [(name, cups)] of the countries drawn most often with name, from the
+    # teams of the cups that have it. The second country of a name is
+    # 'name #2', the third 'name #3'...
+    def Partners(self, name, limit=10):
+        rows = self.db.execute(
+            "SELECT slots.cup, slots.slot, slots.grp, cups.teams, setups.rules"
+            " FROM slots"
+            " JOIN cups ON cups.id = slots.cup"
+            " JOIN setups ON setups.id = cups.setup"
+            " WHERE slots.country IN"
+            " (SELECT id FROM countries WHERE name = ?)", (name,))
+        sizes = {}
+        # {cup: set of the country ids in a group with name}
+        partners_of = {}
+        for cup_id, slot, grp, blob, rules in rows:
+            size = sizes.get(rules)
+            if size is None:
+                size = sizes[rules] = json.loads(rules)['format']['group_size']
+            teams = array('I')
+            teams.frombytes(blob)
+            partners = partners_of.setdefault(cup_id, set())
+            for i in range(grp * size, (grp + 1) * size):
+                if i != slot:
+                    partners.add(teams[i])
+        counts = {}
+        for partners in partners_of.values():
+            for country_id in partners:
+                counts[country_id] = counts.get(country_id, 0) + 1
+
+        labels = {country_id: other if number == 0 else
+                  "{name} #{n}".format(name=other, n=number + 1)
+                  for country_id, other, number in self.db.execute(
+                      "SELECT id, name, number FROM countries")}
+        partners = [(labels[country_id], n)
+                    for country_id, n in counts.items()]
+        partners.sort(key=lambda p: (-p[1], p[0]))
+        return partners[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='wcg-history',
+        description="Ask the history of generated World Cups.")
+    parser.add_argument('history', help="history file (SQLite)")
+    parser.add_argument('--drawn', metavar='NAME',
+                        help="cups with the country")
+    parser.add_argument('--together', nargs=2, metavar='NAME',
+                        help="cups with both countries in the same group")
+    parser.add_argument('--partners', metavar='NAME',
+                        help="countries drawn most often with this one")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.history):
+        parser.error("{file} don't exist".format(file=args.history))
+    with History(args.history) as history:
+        cups = history.Cups()
+        print("{n} cups".format(n=cups))
+        if args.drawn:
+            n = history.Drawn(args.drawn)
+            print("{name}: {n} cups ({p:.2%})".format(
+                name=args.drawn, n=n, p=n / max(1, cups)))
+        if args.together:
+            n = history.Together(*args.together)
+            print("{a} with {b}: {n} cups ({p:.2%})".format(
+                a=args.together[0], b=args.together[1], n=n,
+                p=n / max(1, cups)))
+        if args.partners:
+            for name, n in history.Partners(args.partners):
+                print("{name:<28} {n:>8}".format(name=name, n=n))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+# Translations that cost nothing until a text is shown. The core modules
+# (data, gen, quota...) import _ from here, so they work without gettext
+# installed and without paying for it at import time. The catalog is
+# loaded on the first translated text
+
+import os
+import builtins
+
+LOCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'locales')
+
+_translation = None
+
+
+# mark a text to translate when it is shown, not now (xgettext -k N_)
+def N_(text):
+    return text
+
+
+def _(text):
+    global _translation
+    if _translation is None:
+        import gettext
+        _translation = gettext.translation('wcg', LOCALE_DIR, fallback=True)
+    return _translation.gettext(text)
+
+
+# make _ a builtin, for the GUI modules and the scripts
+def Install():
+    builtins._ = _
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# Load country files on a worker thread, without holding the whole file.
+# Nothing here touch wx, the callbacks decide how to reach the GUI
+
+import os
+import json
+import codecs
+import threading
+import countrydb
+from data import Country, GetRegionById
+from i18n import _
+
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 2000
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _Eof(Exception):
+    pass
+
+
+# read the top level object of a JSON file one member at time
+# yield (line, key, value), line is where the member starts (1 based)
+# on_read(bytes read) is called after each chunk
+# raise ValueError with the line when the JSON is invalid
+def IterJSONObject(data_file, chunk_size=CHUNK_SIZE, on_read=None):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    # 'line' is the line number at the index 'counted' of 'buf'
+    state = {'buf': '', 'pos': 0, 'line': 1, 'counted': 0,
+             'eof': False, 'read': 0}
+
+    def more():
+        if state['eof']:
+            raise _Eof()
+        data = data_file.read(chunk_size)
+        state['read'] += len(data)
+        state['eof'] = not data
+        # drop what was already parsed
+        line_at(state['pos'])
+        state['buf'] = state['buf'][state['pos']:] + decoder.decode(data,
+                                                                   final=not data)
+        state['pos'] = 0
+        state['counted'] = 0
+        if on_read is not None:
+            on_read(state['read'])
+
+    # count only the text not counted yet, positions only move forward
+    def line_at(pos):
+        if pos > state['counted']:
+            state['line'] += state['buf'].count('\n', state['counted'], pos)
+            state['counted'] = pos
+        return state['line']
+
+    def line():
+        return line_at(state['pos'])
+
+    def skip():
+        while True:
+            buf, pos = state['buf'], state['pos']
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            state['pos'] = pos
+            if pos < len(buf):
+                return buf[pos]
+            more()
+
+    def value():
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(state['buf'], state['pos'])
+                # a number may continue in the next chunk
+                if end < len(state['buf']) or state['eof']:
+                    state['pos'] = end
+                    return obj
+            except json.JSONDecodeError as e:
+                if state['eof']:
+                    raise ValueError("{msg} (line {line})".format(
+                        msg=e.msg, line=line_at(e.pos)))
+            more()
+
+    def expect(char):
+        if skip() != char:
+            raise ValueError("Expecting '{char}' (line {line})".format(
+                char=char, line=line()))
+        state['pos'] += 1
+
+    try:
+        expect('{')
+        if skip() == '}':
+            return
+        while True:
+            skip()
+            start = line()
+            key = value()
+            if not isinstance(key, str):
+                raise ValueError("Expecting a name (line {line})".format(
+                    line=start))
+            expect(':')
+            skip()
+            yield start, key, value()
+            if skip() == '}':
+                return
+            expect(',')
+    except _Eof:
+        raise ValueError("Unexpected end of file (line {line})".format(
+            line=line()))
+
+
+# validate one member of a country JSON file
+# return the Country or raise ValueError with the problem
+def ParseCountry(entry):
+    try:
+        name = entry['name']
+        region_id = entry['region']
+        seeder = entry['seeder']
+        win_chance = entry['win_chance']
+    except (TypeError, KeyError) as e:
+        raise ValueError(_("Missing field {field}").format(field=e))
+    region = GetRegionById(region_id)
+    if region is None:
+        raise ValueError(
+            _("Region '{region}' of Country '{country}' don't exist").format(
+                region=region_id, country=name))
+    return Country(name, region, seeder, win_chance)
+
+
+# Worker thread that load a JSON or .wcgdb country file
+# callbacks, all called from the worker thread:
+#   on_batch(countries)       a list of validated countries
+#   on_error(line, message)   an invalid country, the load goes on
+#   on_progress(fraction)     0.0 to 1.0 of the file read
+#   on_done(error)            the end, error is None, the message of a
+#                             fatal problem, or False if cancelled
+class CountryLoader(threading.Thread):
+    def __init__(self, file_name, on_batch, on_error, on_progress, on_done,
+                 batch_size=BATCH_SIZE):
+        threading.Thread.__init__(self, daemon=True)
+        self.file_name = file_name
+        self.on_batch = on_batch
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.batch_size = batch_size
+        self.cancelled = threading.Event()
+
+    def Cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            if self.file_name.endswith(countrydb.EXTENSION):
+                self._loadDatabase()
+            else:
+                self._loadJSON()
+        except (OSError, ValueError) as e:
+            self.on_done(str(e))
+            return
+        self.on_done(False if self.cancelled.is_set() else None)
+
+    def _loadJSON(self):
+        size = os.path.getsize(self.file_name) or 1
+        batch = []
+        with open(self.file_name, 'rb') as data_file:
+            members = IterJSONObject(
+                data_file,
+                on_read=lambda n: self.on_progress(min(1.0, n / size)))
+            for line, key, entry in members:
+                if self.cancelled.is_set():
+                    return
+                try:
+                    batch.append(ParseCountry(entry))
+                except ValueError as e:
+                    self.on_error(line, str(e))
+                    continue
+                if len(batch) >= self.batch_size:
+                    self.on_batch(batch)
+                    batch = []
+        if batch:
+            self.on_batch(batch)
+
+    def _loadDatabase(self):
+        with countrydb.CountryDB(self.file_name) as db:
+            for first in range(0, len(db), self.batch_size):
+                if self.cancelled.is_set():
+                    return
+                last = min(len(db), first + self.batch_size)
+                self.on_batch([db.Country(i) for i in range(first, last)])
+                self.on_progress(last / len(db))
@@ -1,18 +1,35 @@
 #!/usr/bin/env python3
 
-import gettext
-gettext.install('wcg', './locales')
+import i18n
+i18n.Install()
 
-import sys
-print(sys.argv[0])
 
-from wx import App
-from gui import MainFrame
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='wcg')
+    parser.add_argument('--regions', metavar='FILE',
+                        help="regions of the countries, JSON {id: name},"
+                             " default is the FIFA confederations")
+    parser.add_argument('--history', metavar='FILE',
+                        help="store the generated cups in this file,"
+                             " default is ~/.wcg_history.db")
+    args = parser.parse_args(argv)
+    if args.regions:
+        from data import LoadRegions, SetRegions
+        try:
+            SetRegions(LoadRegions(args.regions))
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
 
+    # wx and the GUI are loaded only when the GUI starts
+    from wx import App
+    from gui import MainFrame, HISTORY_FILE
 
-if __name__ == '__main__':
     app = App()
-    frame = MainFrame()
+    frame = MainFrame(args.history or HISTORY_FILE)
     frame.Show()
     app.MainLoop()
 
+
+if __name__ == '__main__':
+    main()
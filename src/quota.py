@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+from data import AsCountryTable, RegionCounts
+from i18n import _
+
+
+# slots of the cup a region can use: its maximum, and when the groups are
+# separated no more than group_max teams in each group
+def RegionMax(rules, region_id, default):
+    hi = rules['max'].get(region_id, default)
+    if rules.get('SeparateRegions'):
+        hi = min(hi, rules['format'].groups *
+                     rules['group_max'].get(region_id, 1))
+    return hi
+
+
+# with the seeders on and the regions separated the draw is FIFA style:
+# the seeders only go to the seeder slots, the other slots take non seeders
+def SeedersApart(rules):
+    return bool(rules['SeedersOn'] and rules.get('SeparateRegions') and
+                rules['format'].seeded)
+
+
+# Keep track of the rules while a world cup is generated, so every pick
+# leaves the remaining slots still possible to fill.
+#   nSeeders => seeder slots to fill, they need countries with seeder flag
+#   nOthers => slots that accept any country
+#
+# For each region we know the available seeders (a) and non seeders (b),
+# the minimum still missing (lo) and the slots it still can use (hi).
+# The remaining slots can be filled if and only if:
+#   lo <= min(hi, a + b) for every region
+#   sum(min(a, hi)) >= nSeeders
+#   sum(min(hi, a + b)) >= nSeeders + nOthers
+#   sum(lo) + max(0, nSeeders - sum(min(lo, a))) <= nSeeders + nOthers
+# the last one is because a seeder picked to fill a region minimum is free,
+# while any other seeder spends one more slot.
+# When SeedersApart, nOthers need countries without the flag, and the same
+# holds for them (the problem is symmetric), so it also need:
+#   sum(min(b, hi)) >= nOthers
+#   sum(lo) + max(0, nOthers - sum(min(lo, b))) <= nSeeders + nOthers
+# The sums are kept updated, so each check costs O(1) and the whole plan
+# O(R + freezed), the counts per region come from the CountryTable
+# countries is a CountryTable, a list of countries or a RegionCounts (only
+# the counts are known, so freezed should be empty)
+class QuotaPlan:
+    def __init__(self, rules, countries, freezed, nSeeders, nOthers):
+        self.seeders = nSeeders
+        self.others = nOthers
+        self.apart = SeedersApart(rules)
+
+        if isinstance(countries, RegionCounts):
+            table = countries
+        else:
+            table = AsCountryTable(countries)
+        counts = table.Counts()
+        self.regions = {}
+        for r in table.regions:
+            others, seeders = counts.get(r.id, (0, 0))
+            self.regions[r.id] = [seeders, others,
+                                  rules['mins'].get(r.id, 0),
+                                  RegionMax(rules, r.id, nSeeders + nOthers)]
+
+        # a freezed country of the pool use a slot and is not available
+        for c in set(freezed):
+            if table.Index(c) is None:
+                continue
+            state = self.regions[c.region.id]
+            state[2] = max(0, state[2] - 1)
+            state[3] = max(0, state[3] - 1)
+            if c.seeder:
+                state[0] -= 1
+            else:
+                state[1] -= 1
+
+        self.sums = [0, 0, 0, 0, 0, 0]
+        for state in self.regions.values():
+            self._addTerms(state, 1)
+
+    def Problem(self):
+        for region_id in self.RegionProblems():
+            return _("Region '{region}' can't reach the minimum"
+                     " of {n} countries.").format(
+                         region=region_id, n=self.regions[region_id][2])
+
+        seeder_cap, cap, lo_sum, free_seeders, others_cap, free_others = \
+            self.sums
+        total = self.seeders + self.others
+        if seeder_cap < self.seeders:
+            return _("Need at least {n} seeders available.").format(
+                n=self.seeders)
+        if self.apart and others_cap < self.others:
+            return _("Need at least {n} non seeders available.").format(
+                n=self.others)
+        if cap < total:
+            return _("Need at least {n} countries available.").format(
+                n=total)
+        if (lo_sum + max(0, self.seeders - free_seeders) > total or
+                self.apart and
+                lo_sum + max(0, self.others - free_others) > total):
+            return _("The minimum per region need more"
+                     " than {n} slots.").format(n=total)
+        return None
+
+    # False when no order of the picks left can break the plan, so it has
+    # nothing to check. Without minimums a pick lower the slots and the
+    # countries by one, so the total keep its slack, and the seeders slack
+    # only go down (by one) on a pick for the other slots
+    def NeedsChecks(self):
+        seeder_cap, cap, lo_sum, free_seeders, others_cap, free_others = \
+            self.sums
+        if lo_sum > 0 or seeder_cap - self.seeders < self.others:
+            return True
+        return self.apart and others_cap - self.others < self.seeders
+
+    # ids of the regions that can't reach their minimum alone
+    def RegionProblems(self):
+        return [region_id for region_id, (a, b, lo, hi) in self.regions.items()
+                if lo > min(hi, a + b)]
+
+    # a pick lower the seeders slack and the minimums slack by at most one,
+    # the other conditions can't break, so while both slacks are positive
+    # any country of a region with free slots can be taken
+    def AnyPickIsSafe(self):
+        seeder_cap, cap, lo_sum, free_seeders, others_cap, free_others = \
+            self.sums
+        total = self.seeders + self.others
+        if not ((self.seeders <= 0 or seeder_cap - self.seeders >= 1) and
+                total - lo_sum - max(0, self.seeders - free_seeders) >= 1):
+            return False
+        return not self.apart or (
+            (self.others <= 0 or others_cap - self.others >= 1) and
+            total - lo_sum - max(0, self.others - free_others) >= 1)
+
+    # True if taking a country of the region keeps the plan possible
+    def CanTake(self, region_id, seeder, isSeederSlot):
+        if self.apart and bool(seeder) != bool(isSeederSlot):
+            return False
+        state = self.regions[region_id]
+        after = self._after(state, seeder)
+        if after is None:
+            return False
+
+        a, b, lo, hi = after
+        if lo > min(hi, a + b):
+            return False
+
+        old = self._terms(state)
+        new = self._terms(after)
+        seeder_cap, cap, lo_sum, free_seeders, others_cap, free_others = [
+            s - o + n for s, o, n in zip(self.sums, old, new)]
+        seeders = self.seeders - (1 if isSeederSlot else 0)
+        others = self.others - (0 if isSeederSlot else 1)
+        total = self.seeders + self.others - 1
+        if not (seeder_cap >= seeders and cap >= total and
+                lo_sum + max(0, seeders - free_seeders) <= total):
+            return False
+        return not self.apart or (
+            others_cap >= others and
+            lo_sum + max(0, others - free_others) <= total)
+
+    def Take(self, region_id, seeder, isSeederSlot):
+        state = self.regions[region_id]
+        self._addTerms(state, -1)
+        state[:] = self._after(state, seeder)
+        self._addTerms(state, 1)
+        if isSeederSlot:
+            self.seeders -= 1
+        else:
+            self.others -= 1
+
+    def _after(self, state, seeder):
+        a, b, lo, hi = state
+        if seeder:
+            a -= 1
+        else:
+            b -= 1
+        if a < 0 or b < 0 or hi <= 0:
+            return None
+        return [a, b, max(0, lo - 1), hi - 1]
+
+    def _terms(self, state):
+        a, b, lo, hi = state
+        return (min(a, hi), min(hi, a + b), lo, min(lo, a),
+                min(b, hi), min(lo, b))
+
+    def _addTerms(self, state, sign):
+        a, b, lo, hi = state
+        sums = self.sums
+        sums[0] += sign * (a if a < hi else hi)
+        sums[1] += sign * (a + b if a + b < hi else hi)
+        sums[2] += sign * lo
+        sums[3] += sign * (a if a < lo else lo)
+        sums[4] += sign * (b if b < hi else hi)
+        sums[5] += sign * (b if b < lo else lo)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import random
+import hashlib
+
+
+# Independent random streams derived from one master seed, in the style of
+# numpy SeedSequence. A stream is named by the master entropy plus its
+# spawn key (the path of child indexes), so the same key always give the
+# same stream no matter which process or thread ask for it.
+class SeedSequence:
+    def __init__(self, entropy=None, spawn_key=()):
+        if entropy is None:
+            entropy = random.SystemRandom().getrandbits(64)
+        self.entropy = entropy
+        self.spawn_key = tuple(spawn_key)
+        self.n_children = 0
+
+    # next n children, never repeating the ones given before
+    def Spawn(self, n):
+        children = [self.Child(self.n_children + i) for i in range(n)]
+        self.n_children += n
+        return children
+
+    # child i, without changing the spawn counter
+    def Child(self, i):
+        return SeedSequence(self.entropy, self.spawn_key + (i,))
+
+    # 64 bits seed of this stream, hashed so near keys give unrelated seeds
+    def GenerateSeed(self):
+        key = repr((self.entropy, self.spawn_key)).encode('ascii')
+        return int.from_bytes(hashlib.sha256(key).digest()[:8], 'big')
+
+    def Generator(self):
+        return random.Random(self.GenerateSeed())
@@ -1,86 +1,230 @@
 # -*- coding: utf-8 -*-
 
-from collections import Counter
+import random
 import wx
-from data import GetRegions
+from data import GetRegions, CountryTable, CUP_FORMATS
+from gen import AllRandom, GenerateCup, NeededSlots
+from quota import QuotaPlan
+from worker import Worker
 
+# pause in the sliding before the expected counts are computed again
+PREVIEW_DELAY_MS = 200
+# random cups drawn to estimate the expected count of each region
+PREVIEW_RUNS = 200
 
+
+# region_counts is the RegionCounts of the countries
+# while the minimums change the dialog tell if the cup can be made and
+# how many countries of each region a random draw would pick on average
 class RulesEditor(wx.Dialog):
-    def __init__(self, parent, rules, countries):
+    def __init__(self, parent, rules, region_counts, countries):
         wx.Dialog.__init__(self, parent,
                            id=wx.ID_ANY,
                            title=wx.EmptyString,
                            pos=wx.DefaultPosition,
-                           size=wx.Size(500,360),
+                           size=wx.Size(560,430),
                            style=wx.DEFAULT_DIALOG_STYLE)
         self.rules = rules
+        self.formats = list(CUP_FORMATS)
+        if rules['format'] not in self.formats:
+            self.formats.append(rules['format'])
+        self.region_counts = region_counts
+        self.countries = countries
+        # {region id: minimum} and their sum, kept updated on every slide
+        # so the bound of each slider cost O(1)
+        self.values = {}
+        self.sum_mins = 0
+        # {region id: maximum of the slider}, the widgets only change when
+        # their maximum change
+        self.maxima = {}
+
+        # expected counts computed on a worker thread, see _startPreview
+        self.preview = None
+        self.preview_timer = None
+        self.table = None
         self.gui_init()
-        self.countriesPerRegion = Counter([c.region.id for c in countries])
 
     def GetRules(self):
-        for region, s in self.sliders.items():
-            slider, *ignored = s
-            self.rules['mins'][region] = slider.GetValue()
-            self.rules['max'][region] = self._nSlotsRegionCanUse(region)
-        self.rules['SeedersOn'] = self.chk_seeder.GetValue()
+        self.rules.update(self._currentRules())
         return self.rules
 
     def onInit(self, event):
         for region, s in self.sliders.items():
             slider, *ignored = s
             slider.SetValue(self.rules['mins'][region])
+            self.values[region] = slider.GetValue()
+        self.sum_mins = sum(self.values.values())
         self.chk_seeder.SetValue(self.rules['SeedersOn'])
+        self.chk_separate.SetValue(self.rules.get('SeparateRegions', False))
+        self.cmb_format.SetSelection(self.formats.index(self.rules['format']))
         self._UpdateSliders()
 
     def onSlide(self, event):
+        slider = event.GetEventObject()
+        value = slider.GetValue()
+        self.sum_mins += value - self.values[slider.wcg_region]
+        self.values[slider.wcg_region] = value
+        self._UpdateSliders()
+
+    # the seeder and the separate regions options
+    def onSeeder(self, event):
+        self._UpdateFeasibility()
+
+    # a smaller cup may not fit the old minimums, start them again
+    def onFormat(self, event):
+        if self.sum_mins > self._format().teams:
+            for region, s in self.sliders.items():
+                slider, *ignored = s
+                slider.SetValue(0)
+                self.values[region] = 0
+            self.sum_mins = 0
         self._UpdateSliders()
 
     def onSave(self, event):
+        self._stopPreview()
         self.EndModal(wx.ID_OK)
 
     def onCancel(self, event):
+        self._stopPreview()
         self.EndModal(wx.ID_CANCEL)
 
+    def onClose(self, event):
+        self._stopPreview()
+        event.Skip()
+
     def _UpdateSliders(self):
         for region_id, slider_block in self.sliders.items():
             slider, text = slider_block
             free_slots = self._nSlotsRegionCanUse(region_id)
-            maximun = min(free_slots, self.countriesPerRegion[region_id])
+            maximun = min(free_slots,
+                          self.region_counts.Countries(region_id))
+            text.SetLabel(str(self.values[region_id]))
+            if self.maxima.get(region_id) == maximun:
+                continue
+            self.maxima[region_id] = maximun
             if maximun == 0:
                 slider.Disable()
                 maximun = 1
             else:
                 slider.Enable()
             slider.SetMax(maximun)
-            text.SetLabel(str(slider.GetValue()))
+        self._UpdateFeasibility()
 
     def _nSlotsRegionCanUse(self, id):
-        sum_minimun = 0
-        for region_id, slider_block in self.sliders.items():
-            if region_id != id:
-                slider, text = slider_block
-                sum_minimun += slider.GetValue()
-        return 32 - sum_minimun
+        return self._format().teams - (self.sum_mins - self.values[id])
+
+    # the rules as they are in the dialog, a new dict
+    def _currentRules(self):
+        return {'mins': dict(self.values),
+                'max': {r: self._nSlotsRegionCanUse(r) for r in self.values},
+                'SeedersOn': self.chk_seeder.GetValue(),
+                'SeparateRegions': self.chk_separate.GetValue(),
+                'group_max': self.rules.get('group_max') or {},
+                'format': self._format()}
+
+    # the QuotaPlan only need the counts per region, so the check is done
+    # at once, the expected counts wait for the sliding to pause
+    def _UpdateFeasibility(self):
+        rules = self._currentRules()
+        needed_seeders, needed_non_seeders = NeededSlots(rules, {})
+        plan = QuotaPlan(rules, self.region_counts, [],
+                         len(needed_seeders), len(needed_non_seeders))
+        problem = plan.Problem()
+        bad = set(plan.RegionProblems())
+        for region_id, label in self.expected.items():
+            label.SetForegroundColour(self.colours['red'] if region_id in bad
+                                      else self.colours['text'])
+            label.SetLabel("...")
+        self.lbl_feasibility.SetLabel(problem or _("The rules can be met"))
+        self.lbl_feasibility.SetForegroundColour(
+            self.colours['red'] if problem else self.colours['text'])
+
+        self._stopPreview()
+        if not problem:
+            self.preview_timer = wx.CallLater(PREVIEW_DELAY_MS,
+                                              self._startPreview, rules)
+
+    # draw PREVIEW_RUNS random cups on a worker thread, always with the
+    # same seed, so the same rules show the same figures
+    def _startPreview(self, rules):
+        countries = self.countries
+        table = self.table
+
+        def job(progress):
+            pool = table or CountryTable(countries)
+            rng = random.Random(0)
+            totals = dict.fromkeys((r.id for r in pool.regions), 0)
+            for run in range(PREVIEW_RUNS):
+                progress('preview', run, PREVIEW_RUNS)
+                for c in GenerateCup(AllRandom, rules, pool, rng=rng,
+                                     progress=progress):
+                    totals[c.region.id] += 1
+            return pool, {r: n / PREVIEW_RUNS for r, n in totals.items()}
+
+        def later(method):
+            return lambda *args: wx.CallAfter(method, worker, *args)
+
+        worker = Worker(job, lambda *args: None, later(self._onPreviewDone))
+        self.preview = worker
+        worker.start()
+
+    def _onPreviewDone(self, worker, result, error):
+        if not self or worker is not self.preview:
+            return
+        self.preview = None
+        if error is not None:
+            return
+        self.table, expected = result
+        for region_id, label in self.expected.items():
+            label.SetLabel("~{n:.1f}".format(n=expected[region_id]))
+
+    def _stopPreview(self):
+        if self.preview_timer is not None:
+            self.preview_timer.Stop()
+            self.preview_timer = None
+        if self.preview is not None:
+            self.preview.Cancel()
+            self.preview = None
+
+    def _format(self):
+        return self.formats[self.cmb_format.GetSelection()]
 
     def gui_init(self):
         text_seeder = _(" Seeder in the group's first slot")
         text_sliders_header = _(" Minimun number of contries per region")
+        text_format = _("{teams} teams, {groups} groups of {size}")
+        text_expected = _("Expected countries in a random draw")
+        text_separate = _(" One country per region in each group"
+                          " (two of Europe)")
 
         self.SetSizeHints(wx.DefaultSize, wx.DefaultSize)
 
         self.chk_seeder = wx.CheckBox(self, wx.ID_ANY,
                                      text_seeder,
                                      wx.DefaultPosition, wx.DefaultSize, 0)
+        self.chk_separate = wx.CheckBox(self, wx.ID_ANY,
+                                        text_separate,
+                                        wx.DefaultPosition, wx.DefaultSize, 0)
+        self.cmb_format = wx.ComboBox(self, wx.ID_ANY,
+                                      wx.EmptyString,
+                                      wx.DefaultPosition, wx.DefaultSize,
+                                      [text_format.format(teams=f.teams,
+                                                          groups=f.groups,
+                                                          size=f.group_size)
+                                       for f in self.formats],
+                                      wx.CB_READONLY)
 
         sizer_sliders = wx.StaticBoxSizer(wx.StaticBox(self, wx.ID_ANY,
                                                        text_sliders_header,
                                                        style=wx.ALIGN_LEFT),
                                           wx.VERTICAL)
         self.sliders = {}
+        # {region id: label of the expected count}
+        self.expected = {}
         for r in GetRegions():
             b_sizer = wx.BoxSizer(wx.HORIZONTAL)
             static_text = wx.StaticText(sizer_sliders.GetStaticBox(), wx.ID_ANY,
-                                        r.name,
+                                        _(r.name),
                                         wx.DefaultPosition, wx.DefaultSize, wx.ALIGN_RIGHT)
             static_text.Wrap(-1)
             sizer_sliders.Add(b_sizer, 1, wx.ALIGN_RIGHT, 0)
@@ -88,16 +232,34 @@ class RulesEditor(wx.Dialog):
                                          "00",
                                          wx.DefaultPosition, wx.DefaultSize, 0)
             slider = wx.Slider(sizer_sliders.GetStaticBox(), wx.ID_ANY,
-                               0, 0, 32,
+                               0, 0, self.rules['format'].teams,
                                wx.DefaultPosition,
                                wx.Size(150,24),
                                wx.SL_MIN_MAX_LABELS)
             slider.SetBackgroundColour(wx.SystemSettings.GetColour(wx.SYS_COLOUR_WINDOW))
             slider.Bind(wx.EVT_SCROLL, self.onSlide)
+            slider.wcg_region = r.id
+            expected_label = wx.StaticText(sizer_sliders.GetStaticBox(),
+                                           wx.ID_ANY,
+                                           "...",
+                                           wx.DefaultPosition, wx.Size(50, -1),
+                                           wx.ST_NO_AUTORESIZE)
+            expected_label.SetToolTip(text_expected)
             b_sizer.Add(static_text, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5)
             b_sizer.Add(slider, 0, wx.ALL, 5)
             b_sizer.Add(slider_label, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5)
+            b_sizer.Add(expected_label, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5)
             self.sliders[r.id] = [slider, slider_label]
+            self.expected[r.id] = expected_label
+
+        self.colours = {"red": wx.Colour(200, 0, 0),
+                        "text": wx.SystemSettings.GetColour(
+                            wx.SYS_COLOUR_WINDOWTEXT)}
+        self.lbl_feasibility = wx.StaticText(self, wx.ID_ANY,
+                                             wx.EmptyString,
+                                             wx.DefaultPosition,
+                                             wx.DefaultSize,
+                                             wx.ST_NO_AUTORESIZE)
 
         btn_save = wx.Button(self, wx.ID_ANY,
                              _("Save"),
@@ -111,8 +273,11 @@ class RulesEditor(wx.Dialog):
         sizer_buttons.Add(btn_cancel, 0, wx.ALL, 5)
 
         sizer_top = wx.BoxSizer(wx.VERTICAL)
+        sizer_top.Add(self.cmb_format, 0, wx.ALIGN_CENTER|wx.ALL, 5)
         sizer_top.Add(self.chk_seeder, 0, wx.ALIGN_CENTER|wx.ALL, 5)
+        sizer_top.Add(self.chk_separate, 0, wx.ALIGN_CENTER|wx.ALL, 5)
         sizer_top.Add(sizer_sliders, 0, wx.EXPAND, 5)
+        sizer_top.Add(self.lbl_feasibility, 0, wx.EXPAND|wx.ALL, 5)
 
         sizer_main = wx.BoxSizer(wx.VERTICAL)
         sizer_main.Add(sizer_top, 1, wx.EXPAND, 5)
@@ -123,6 +288,10 @@ class RulesEditor(wx.Dialog):
         self.Centre(wx.BOTH)
 
         self.Bind(wx.EVT_INIT_DIALOG, self.onInit)
+        self.cmb_format.Bind(wx.EVT_COMBOBOX, self.onFormat)
+        self.chk_seeder.Bind(wx.EVT_CHECKBOX, self.onSeeder)
+        self.chk_separate.Bind(wx.EVT_CHECKBOX, self.onSeeder)
+        self.Bind(wx.EVT_CLOSE, self.onClose)
         btn_save.Bind(wx.EVT_BUTTON, self.onSave)
         btn_cancel.Bind(wx.EVT_BUTTON, self.onCancel)
 
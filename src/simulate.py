@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Monte Carlo estimation of the chance of each country be in the world cup
+#   ./simulate.py countries.json -r rules.json -m quickleague -n 100000 -j 8
+# freezed slots are given as -f A1=Brasil (group name + position in the group)
+
+import os
+import sys
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from data import LoadCountries, AsCountryTable, LoadRegions, SetRegions
+from gen import GenerateCup, DefaultRules
+from batch import METHODS, LoadRules, CheckPool
+from rng import SeedSequence
+
+# 95% confidence
+Z_SCORE = 1.96
+
+
+# runs in the worker process
+# return ([times qualified], [times in a seeder slot]) indexed as countries,
+# the seeder slots are only counted with rules['SeedersOn']
+# the run i always use the child stream i of the master seed, so the result
+# don't depend on how the runs are split between the workers
+# table is the CountryTable of the pool, shared by all the runs
+def _simulateChunk(args):
+    method_name, rules, table, freezed, first, runs, entropy = args
+    master = SeedSequence(entropy)
+    method_class = METHODS[method_name]
+    fmt = rules['format']
+    seeder_slots = [rules['SeedersOn'] and fmt.IsSeederSlot(pos)
+                    for pos in range(fmt.teams)]
+    qualified = [0] * len(table)
+    seeded = [0] * len(table)
+
+    for run in range(first, first + runs):
+        slots = GenerateCup(method_class, rules, table, freezed,
+                            master.Child(run).Generator())
+        for pos, c in enumerate(slots):
+            i = table.Index(c)
+            qualified[i] += 1
+            if seeder_slots[pos]:
+                seeded[i] += 1
+    return qualified, seeded
+
+
+# Wilson score interval for a proportion
+def WilsonInterval(hits, n, z=Z_SCORE):
+    if n == 0:
+        return 0.0, 1.0
+    p = hits / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+# run the method 'runs' times spread across 'workers' processes
+# return a list of dicts, one per country, sorted by qualification chance,
+# 'seeded' and 'seeded_ci' only with rules['SeedersOn']
+def Simulate(method_name, rules, countries, freezed=None, runs=10000,
+             workers=None, seed=None):
+    freezed = freezed or {}
+    workers = workers or os.cpu_count() or 1
+    entropy = SeedSequence(seed).entropy
+    table = AsCountryTable(countries)
+
+    # a few chunks per worker so a slow one don't hold the others
+    n_chunks = min(runs, workers * 4) or 1
+    jobs = []
+    first = 0
+    for i in range(n_chunks):
+        n = runs // n_chunks + (1 if i < runs % n_chunks else 0)
+        if n > 0:
+            jobs.append((method_name, rules, table, freezed,
+                         first, n, entropy))
+        first += n
+
+    qualified = [0] * len(table)
+    seeded = [0] * len(table)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for q, s in pool.map(_simulateChunk, jobs):
+            for i in range(len(table)):
+                qualified[i] += q[i]
+                seeded[i] += s[i]
+
+    results = []
+    for i, c in enumerate(table.countries):
+        result = {
+            'name': c.name,
+            'region': c.region.id,
+            'qualified': qualified[i] / runs if runs else 0.0,
+            'qualified_ci': WilsonInterval(qualified[i], runs),
+        }
+        if rules['SeedersOn']:
+            result['seeded'] = seeded[i] / runs if runs else 0.0
+            result['seeded_ci'] = WilsonInterval(seeded[i], runs)
+        results.append(result)
+    results.sort(key=lambda r: (-r['qualified'], -r.get('seeded', 0.0),
+                                r['name']))
+    return results
+
+
+# 'A1=Brasil' => {0: <Country Brasil>}
+def ParseFreezed(values, countries, fmt):
+    if not values:
+        return {}
+    by_name = {c.name: c for c in countries}
+    groups = fmt.GroupNames()
+    freezed = {}
+    for value in values:
+        slot, _sep, name = value.partition('=')
+        group = slot.rstrip('0123456789').upper()
+        position = slot[len(group):]
+        if (group not in groups or not position or
+                not 1 <= int(position) <= fmt.group_size):
+            raise ValueError("Invalid slot '{slot}'".format(slot=slot))
+        if name not in by_name:
+            raise ValueError("Unknown country '{name}'".format(name=name))
+        slot = groups.index(group) * fmt.group_size + int(position) - 1
+        freezed[slot] = by_name[name]
+    return freezed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='wcg-simulate',
+        description="Estimate the chance of each country"
+                    " qualify for the World Cup.")
+    parser.add_argument('countries',
+                        help="country file, same format of the Country Editor")
+    parser.add_argument('-r', '--rules',
+                        help="rules file (JSON with 'SeedersOn', 'mins', 'max')")
+    parser.add_argument('-m', '--method', choices=sorted(METHODS),
+                        default='quickleague')
+    parser.add_argument('-n', '--runs', type=int, default=10000)
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker processes, default is one per core")
+    parser.add_argument('-s', '--seed', type=int,
+                        help="master seed, same seed give the same result")
+    parser.add_argument('-f', '--freeze', action='append', default=[],
+                        metavar='SLOT=NAME',
+                        help="keep a country in a slot, like A1=Brasil")
+    parser.add_argument('--regions', metavar='FILE',
+                        help="regions of the countries, JSON {id: name},"
+                             " default is the FIFA confederations")
+    args = parser.parse_args(argv)
+
+    try:
+        # before anything that use the regions
+        if args.regions:
+            SetRegions(LoadRegions(args.regions))
+        countries = AsCountryTable(LoadCountries(args.countries))
+        rules = LoadRules(args.rules) if args.rules else DefaultRules()
+        freezed = ParseFreezed(args.freeze, countries.countries,
+                               rules['format'])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        parser.error(str(e))
+
+    problem = CheckPool(rules, countries, freezed)
+    if problem:
+        parser.error(problem)
+
+    results = Simulate(args.method, rules, countries, freezed,
+                       args.runs, args.jobs, args.seed)
+
+    header = "{:<28} {:>8} {:>17}".format("country", "qualify", "95% CI")
+    if rules['SeedersOn']:
+        header += " {:>8} {:>17}".format("seeded", "95% CI")
+    print(header)
+    for r in results:
+        line = "{:<28} {:>8.4f} {:>8.4f}-{:<8.4f}".format(
+            r['name'], r['qualified'], *r['qualified_ci'])
+        if rules['SeedersOn']:
+            line += " {:>8.4f} {:>8.4f}-{:<8.4f}".format(
+                r['seeded'], *r['seeded_ci'])
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# simulate the world cup itself: round robin groups, then the knockout
+#   ./tournament.py countries.json -r rules.json -c 100 -n 10000 -j 8
+# generate 100 cups and play each one 10000 times, then print the chance
+# of each country reach each stage. The matches use the same model of
+# SuperLeague._getWinner: team1 win with chance w1 / (w1 + w2), no draws
+
+import os
+import sys
+import argparse
+from operator import add
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+from data import LoadCountries, AsCountryTable, LoadRegions, SetRegions
+from gen import GenerateCup, DefaultRules
+from batch import METHODS, LoadRules, CheckPool
+from simulate import ParseFreezed
+from rng import SeedSequence
+
+
+# teams in the knockout: the first power of two that hold the first two of
+# every group, the best of the next places fill the remaining spots
+# (48 teams: 12 groups => 32, like the 2026 World Cup)
+def KnockoutSize(fmt):
+    size = 1
+    while size < 2 * fmt.groups:
+        size *= 2
+    while size > fmt.teams:
+        size //= 2
+    return size
+
+
+def StageNames(fmt):
+    names = ["Group stage"]
+    size = KnockoutSize(fmt)
+    while size > 1:
+        if size == 2:
+            names.append("Final")
+        elif size == 4:
+            names.append("Semi-finals")
+        elif size == 8:
+            names.append("Quarter-finals")
+        else:
+            names.append("Round of {n}".format(n=size))
+        size //= 2
+    names.append("Champion")
+    return names
+
+
+# positions of the seeds in a bracket, 1 x n, n/2 x n/2+1, ...
+def _seededOrder(size):
+    order = [0]
+    while len(order) < size:
+        n = 2 * len(order)
+        order = [x for o in order for x in (o, n - 1 - o)]
+    return order
+
+
+# first round of the knockout: qualifiers is the list of slots ranked as
+# seeds, the seed i plays the seed n - 1 - i like _seededOrder, but two
+# teams of the same group don't meet. Such a pair trade its weaker team
+# with the nearest pair where both new pairs come from different groups,
+# there is one unless a group has more than half of the qualifiers
+def KnockoutBracket(qualifiers, group_size):
+    n = len(qualifiers)
+    if n < 2:
+        return list(qualifiers)
+    half = n // 2
+    group = [t // group_size for t in qualifiers]
+    opponent = [n - 1 - i for i in range(half)]
+    for i in range(half):
+        if group[i] != group[opponent[i]]:
+            continue
+        for j in sorted(range(half), key=lambda j: abs(j - i)):
+            if (group[i] != group[opponent[j]] and
+                    group[j] != group[opponent[i]]):
+                opponent[i], opponent[j] = opponent[j], opponent[i]
+                break
+    bracket = []
+    for i in _seededOrder(n)[::2]:
+        bracket += [qualifiers[i], qualifiers[opponent[i]]]
+    return bracket
+
+
+# play 'runs' tournaments with the cup of 'slots' (as GenerateCup return)
+# return a list, per slot, with how many times the team reached each stage
+# of StageNames(fmt)
+def SimulateTournaments(slots, fmt, runs, rng):
+    chances = [c.win_chance for c in slots]
+    rnd = rng.random
+    size = fmt.group_size
+    groups = [list(range(g * size, (g + 1) * size))
+              for g in range(fmt.groups)]
+
+    # group stage: each match is drawn for all the runs at once
+    points = [[0] * runs for c in slots]
+    for teams in groups:
+        for a, b in combinations(teams, 2):
+            wa = chances[a]
+            total = wa + chances[b]
+            won = [3 if rnd() * total <= wa else 0 for r in range(runs)]
+            points[a] = list(map(add, points[a], won))
+            points[b] = [p + 3 - x for p, x in zip(points[b], won)]
+
+    n_stages = len(StageNames(fmt))
+    counts = [[0] * n_stages for c in slots]
+    for team_counts in counts:
+        team_counts[0] = runs
+
+    knockout = KnockoutSize(fmt)
+    # World Cup bracket: A1 x B2, C1 x D2, ..., B1 x A2, D1 x C2, ...
+    classic = knockout == 2 * fmt.groups and fmt.groups % 2 == 0
+
+    for r in range(runs):
+        def rank(teams):
+            return sorted(teams, key=lambda t: (points[t][r], rnd()),
+                          reverse=True)
+        standings = [rank(teams) for teams in groups]
+
+        if classic:
+            bracket = []
+            for g in range(0, fmt.groups, 2):
+                bracket += [standings[g][0], standings[g + 1][1]]
+            for g in range(0, fmt.groups, 2):
+                bracket += [standings[g + 1][0], standings[g][1]]
+        else:
+            qualifiers = []
+            for place in range(size):
+                if len(qualifiers) >= knockout:
+                    break
+                qualifiers += rank([s[place] for s in standings])
+            bracket = KnockoutBracket(qualifiers[:knockout], size)
+
+        stage = 1
+        for t in bracket:
+            counts[t][stage] += 1
+        while len(bracket) > 1:
+            bracket = [a if rnd() * (chances[a] + chances[b]) <= chances[a]
+                       else b
+                       for a, b in zip(bracket[::2], bracket[1::2])]
+            stage += 1
+            for t in bracket:
+                counts[t][stage] += 1
+    return counts
+
+
+# runs in the worker process, cup i is generated and played with the
+# child stream i of the master seed, table is the CountryTable of the pool
+def _simulateCups(args):
+    method_name, rules, table, freezed, first, cups, runs, entropy = args
+    master = SeedSequence(entropy)
+    method_class = METHODS[method_name]
+    fmt = rules['format']
+    totals = [[0] * len(StageNames(fmt)) for i in range(len(table))]
+
+    for cup in range(first, first + cups):
+        rng = master.Child(cup).Generator()
+        slots = GenerateCup(method_class, rules, table, freezed, rng)
+        counts = SimulateTournaments(slots, fmt, runs, rng)
+        for c, team_counts in zip(slots, counts):
+            i = table.Index(c)
+            totals[i] = list(map(add, totals[i], team_counts))
+    return totals
+
+
+# return the stage names and a list of (country, [chance per stage])
+# sorted by the chance of being the champion
+def Simulate(method_name, rules, countries, freezed=None, cups=100,
+             runs=1000, workers=None, seed=None):
+    freezed = freezed or {}
+    workers = workers or os.cpu_count() or 1
+    entropy = SeedSequence(seed).entropy
+    names = StageNames(rules['format'])
+    table = AsCountryTable(countries)
+
+    n_chunks = min(cups, workers * 4) or 1
+    jobs = []
+    first = 0
+    for i in range(n_chunks):
+        n = cups // n_chunks + (1 if i < cups % n_chunks else 0)
+        if n > 0:
+            jobs.append((method_name, rules, table, freezed,
+                         first, n, runs, entropy))
+        first += n
+
+    totals = [[0] * len(names) for i in range(len(table))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in pool.map(_simulateCups, jobs):
+            totals = [list(map(add, t, c)) for t, c in zip(totals, chunk)]
+
+    n = cups * runs
+    results = [(c, [t / n if n else 0.0 for t in team_totals])
+               for c, team_totals in zip(table.countries, totals)]
+    results.sort(key=lambda r: [-p for p in reversed(r[1])])
+    return names, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='wcg-tournament',
+        description="Estimate the chance of each country"
+                    " reach each stage of the World Cup.")
+    parser.add_argument('countries',
+                        help="country file, same format of the Country Editor")
+    parser.add_argument('-r', '--rules',
+                        help="rules file (JSON with 'SeedersOn', 'mins', 'max'"
+                             " and 'format')")
+    parser.add_argument('-m', '--method', choices=sorted(METHODS),
+                        default='quickleague')
+    parser.add_argument('-c', '--cups', type=int, default=100,
+                        help="number of cups generated")
+    parser.add_argument('-n', '--runs', type=int, default=1000,
+                        help="tournaments played with each cup")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker processes, default is one per core")
+    parser.add_argument('-s', '--seed', type=int,
+                        help="master seed, same seed give the same result")
+    parser.add_argument('-f', '--freeze', action='append', default=[],
+                        metavar='SLOT=NAME',
+                        help="keep a country in a slot, like A1=Brasil")
+    parser.add_argument('--regions', metavar='FILE',
+                        help="regions of the countries, JSON {id: name},"
+                             " default is the FIFA confederations")
+    args = parser.parse_args(argv)
+
+    try:
+        # before anything that use the regions
+        if args.regions:
+            SetRegions(LoadRegions(args.regions))
+        countries = AsCountryTable(LoadCountries(args.countries))
+        rules = LoadRules(args.rules) if args.rules else DefaultRules()
+        freezed = ParseFreezed(args.freeze, countries.countries,
+                               rules['format'])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        parser.error(str(e))
+
+    problem = CheckPool(rules, countries, freezed)
+    if problem:
+        parser.error(problem)
+
+    names, results = Simulate(args.method, rules, countries, freezed,
+                              args.cups, args.runs, args.jobs, args.seed)
+
+    print("{:<28}".format("country") +
+          "".join(" {:>14}".format(n) for n in names))
+    for c, chances in results:
+        print("{:<28}".format(c.name) +
+              "".join(" {:>14.4f}".format(p) for p in chances))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Run a long job (a world cup generation, a simulation) on a worker thread,
+# so the GUI keep answering. Nothing here touch wx, like loader.py
+
+import time
+import threading
+import traceback
+
+# seconds between two progress reports
+PROGRESS_INTERVAL = 0.1
+
+
+class Cancelled(Exception):
+    pass
+
+
+# job(progress) do the work and return its result, it should call
+# progress(stage, done, total) from time to time, like gen.GenMethod does
+# callbacks, all called from the worker thread:
+#   on_progress(stage, done, total)   at most once per PROGRESS_INTERVAL,
+#                                     plus the end of each stage
+#   on_done(result, error)            error is None, the message of a
+#                                     ValueError, or False if cancelled.
+#                                     Any other exception is a bug: its
+#                                     traceback goes to stderr and error
+#                                     is its type and message
+class Worker(threading.Thread):
+    def __init__(self, job, on_progress, on_done):
+        threading.Thread.__init__(self, daemon=True)
+        self.job = job
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancelled = threading.Event()
+        self.last_report = 0.0
+
+    def Cancel(self):
+        self.cancelled.set()
+
+    # the job stop at its next progress call
+    def _progress(self, stage, done, total):
+        if self.cancelled.is_set():
+            raise Cancelled()
+        now = time.monotonic()
+        if done >= total or now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            self.on_progress(stage, done, total)
+
+    def run(self):
+        try:
+            result = self.job(self._progress)
+        except Cancelled:
+            self.on_done(None, False)
+            return
+        except ValueError as e:
+            self.on_done(None, str(e))
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.on_done(None, "{kind}: {error}".format(
+                kind=type(e).__name__, error=e))
+            return
+        self.on_done(result, None)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+# the tests import the modules of src/ like the scripts there do
+
+import os
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+COUNTRIES = os.path.join(SRC, '..', 'data', 'coutries_PT.json')
+
+
+# the countries of the sample file, a new list for each test
+@pytest.fixture
+def countries():
+    from data import LoadCountries
+    return LoadCountries(COUNTRIES)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# a .wcgdb is loaded as a CountryTable over the file, the countries are
+# only built when asked and generate the same cups as the JSON file
+
+import pickle
+import random
+
+import countrydb
+from data import CountryTable, LoadCountries
+from gen import AllRandom, DefaultRules, GenerateCup
+
+
+def _load(countries, tmp_path):
+    file_name = str(tmp_path / ('countries' + countrydb.EXTENSION))
+    countrydb.Save(file_name, countries)
+    return LoadCountries(file_name)
+
+
+def test_table_over_the_file(countries, tmp_path):
+    table = _load(countries, tmp_path)
+    assert isinstance(table, CountryTable)
+    assert len(table) == len(countries)
+    assert table.Counts() == CountryTable(countries).Counts()
+
+    c = table.countries[5]
+    assert c is table.countries[5]
+    assert table.Index(c) == 5
+    assert table.Index(countries[5]) is None
+    assert (c.name, c.region, c.seeder, c.win_chance) == (
+        countries[5].name, countries[5].region, countries[5].seeder,
+        countries[5].win_chance)
+
+
+def test_same_cups_as_the_list(countries, tmp_path):
+    table = _load(countries, tmp_path)
+    rules = DefaultRules()
+    for seed in range(10):
+        expected = GenerateCup(AllRandom, rules, countries,
+                               rng=random.Random(seed))
+        cup = GenerateCup(AllRandom, rules, table, rng=random.Random(seed))
+        assert [c.name for c in cup] == [c.name for c in expected]
+    # only the picked countries were built
+    assert len(table.countries._built) < len(table)
+
+
+def test_pickled_table_keep_the_built_countries(countries, tmp_path):
+    table = _load(countries, tmp_path)
+    freezed = {0: table.countries[3]}
+    table2, freezed2 = pickle.loads(pickle.dumps((table, freezed)))
+    assert table2.Index(freezed2[0]) == 3
+    assert table2.countries[3] is freezed2[0]
+    assert list(table2.seeder) == list(table.seeder)
+
+
+def test_unpickled_tables_share_the_file(countries, tmp_path):
+    table = _load(countries, tmp_path)
+    table2 = pickle.loads(pickle.dumps(table))
+    table3 = pickle.loads(pickle.dumps(table))
+    assert table2.countries.db is table3.countries.db
+    assert table2.countries.db is not table.countries.db
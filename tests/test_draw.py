@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# the groups drawn with the regions separated keep the limits, the seeders
+# stay in the seeder slots and a hard freeze doesn't hang the draw
+
+import random
+
+import pytest
+
+from data import CountryTable
+from gen import AllRandom, DefaultRules, GenerateCup
+
+
+def _setup(countries, seeders):
+    by_name = {c.name: c for c in countries}
+    rules = DefaultRules()
+    rules['SeedersOn'] = seeders
+    rules['SeparateRegions'] = True
+    return rules, CountryTable(countries), by_name
+
+
+def _checkGroups(rules, slots):
+    size = rules['format'].group_size
+    for g in range(rules['format'].groups):
+        group = [c.region.id for c in slots[g * size:(g + 1) * size]]
+        for region in set(group):
+            assert group.count(region) <= rules['group_max'].get(region, 1)
+
+
+def test_seeders_stay_in_seeder_slots(countries):
+    rules, pool, by_name = _setup(countries, True)
+    fmt = rules['format']
+    freezed = {0: by_name['Brasil'], 4: by_name['Alemanha'],
+               1: by_name['Israel']}
+    for seed in range(20):
+        slots = GenerateCup(AllRandom, rules, pool, freezed,
+                            random.Random(seed))
+        _checkGroups(rules, slots)
+        for i, c in enumerate(slots):
+            assert bool(c.seeder) == fmt.IsSeederSlot(i)
+
+
+def test_seeder_freezed_in_other_slot(countries):
+    rules, pool, by_name = _setup(countries, True)
+    freezed = {0: by_name['Brasil'], 1: by_name['Alemanha']}
+    with pytest.raises(ValueError, match='Alemanha'):
+        GenerateCup(AllRandom, rules, pool, freezed, random.Random(0))
+
+
+# freezes that sent the old search into an endless backtracking
+def test_hard_freezes_end(countries):
+    rules, pool, by_name = _setup(countries, False)
+    names = ('Brasil', 'Alemanha', 'Israel')
+    for slots in [(3, 7, 11), (0, 1, 4), (0, 4, 1)]:
+        freezed = {i: by_name[name] for i, name in zip(slots, names)}
+        for seed in range(50):
+            cup = GenerateCup(AllRandom, rules, pool, freezed,
+                              random.Random(seed))
+            _checkGroups(rules, cup)
+            for i, c in freezed.items():
+                assert cup[i] is c
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# two countries of the same name are two countries of the history, and
+# the cups of a failed Flush are not lost
+
+import random
+import sqlite3
+
+import pytest
+
+from data import Country, SyntheticCountries, GetRegions
+from gen import DefaultRules, GenerateCup, AllRandom
+from history import History
+
+
+def test_duplicated_names_are_kept_apart(tmp_path):
+    countries = SyntheticCountries(40, random.Random(1))
+    region = GetRegions()[0]
+    twins = [Country("Twin", region), Country("Twin", region)]
+    countries[:2] = twins
+    rules = DefaultRules()
+    rules['SeedersOn'] = False
+    cups = [GenerateCup(AllRandom, rules, countries, rng=random.Random(i))
+            for i in range(300)]
+
+    with History(str(tmp_path / 'history.db')) as history:
+        setup = history.Setup('random', rules, countries=countries)
+        for i, cup in enumerate(cups):
+            history.Add(setup, cup, i)
+        history.Flush()
+
+        def group(cup, c):
+            return cup.index(c) // rules['format'].group_size
+
+        drawn = [cup for cup in cups if any(c in cup for c in twins)]
+        both = [cup for cup in cups if all(c in cup for c in twins) and
+                group(cup, twins[0]) == group(cup, twins[1])]
+        other = countries[5]
+        with_other = [cup for cup in cups if other in cup and
+                      any(c in cup and group(cup, c) == group(cup, other)
+                          for c in twins)]
+        assert history.Drawn("Twin") == len(drawn)
+        assert history.Together("Twin", "Twin") == len(both)
+        assert history.Together("Twin", other.name) == len(with_other)
+        assert history.db.execute(
+            "SELECT count(*) FROM countries WHERE name = 'Twin'"
+        ).fetchone()[0] == 2
+        partners = dict(history.Partners("Twin", limit=100))
+        assert partners.get("Twin #2", 0) + partners.get("Twin", 0) == \
+            2 * len(both)
+
+
+# a batch that fail to be written stay for the next Flush
+def test_failed_flush_keep_the_cups(tmp_path):
+    countries = SyntheticCountries(40, random.Random(2))
+    rules = DefaultRules()
+    cups = [GenerateCup(AllRandom, rules, countries, rng=random.Random(i))
+            for i in range(4)]
+    file_name = str(tmp_path / 'history.db')
+
+    with History(file_name, batch_size=100) as history:
+        setup = history.Setup('random', rules, countries=countries)
+        history.Add(setup, cups[0], 0)
+        history.Add(setup, cups[1], 1)
+        # another writer hold the file
+        history.db.execute("PRAGMA busy_timeout=0")
+        other = sqlite3.connect(file_name, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        with pytest.raises(sqlite3.OperationalError):
+            history.Flush()
+        other.execute("ROLLBACK")
+        other.close()
+
+        # and a cup that can't be written, after the countries got ids
+        history.Add(setup, cups[2][:-1] + [None], 2)
+        with pytest.raises(AttributeError):
+            history.Flush()
+        assert [seed for s, seed, slots in history.pending] == ['0', '1', '2']
+
+        history.pending.pop()
+        history.Add(setup, cups[3], 3)
+        history.Flush()
+        assert history.pending == []
+        assert history.db.execute(
+            "SELECT seed FROM cups ORDER BY id").fetchall() == [
+            ('0',), ('1',), ('3',)]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+# the core modules are imported by every worker process and headless run,
+# they should not load the GUI, the translations or the process pool. The
+# time of each import is measured by bench.py, see IMPORT_BUDGET
+
+import os
+import subprocess
+import sys
+
+import data
+
+SRC = os.path.dirname(os.path.abspath(data.__file__))
+
+CORE_MODULES = ['data', 'gen', 'quota', 'draw', 'countrydb']
+HEAVY_MODULES = ['wx', 'json', 'gettext', 'multiprocessing',
+                 'concurrent.futures', 'sqlite3']
+
+_CODE = """
+import sys
+import {module}
+print(' '.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def _loadedWith(module):
+    code = _CODE.format(module=module, heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, '-c', code], cwd=SRC, check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True)
+    return out.stdout.split()
+
+
+def test_core_imports_stay_light():
+    for module in CORE_MODULES:
+        assert _loadedWith(module) == [], module
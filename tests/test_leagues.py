@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# the league engines play the same league as SuperLeague
+
+import random
+
+import gen
+from data import Country, CountryTable, GetRegions, SyntheticCountries
+from gen import DefaultRules, EloLeague, GenerateCup, LeagueTable, QuickLeague
+from gen import ParallelLeague, SuperLeague
+
+
+def _pool(n, seed=1):
+    return CountryTable(SyntheticCountries(n, random.Random(seed)))
+
+
+def test_quick_league_same_standings():
+    pool = _pool(61)
+    rules = DefaultRules()
+    for seed in range(5):
+        slow = SuperLeague(rules, pool, [], rng=random.Random(seed))
+        quick = QuickLeague(rules, pool, [], rng=random.Random(seed))
+        assert quick.points == slow.points
+        assert sum(quick.points) == 3 * 61 * 60 // 2
+
+        expected = GenerateCup(SuperLeague, rules, pool,
+                               rng=random.Random(seed))
+        assert GenerateCup(QuickLeague, rules, pool,
+                           rng=random.Random(seed)) == expected
+
+
+# every pair played once, the points are the wins
+def _checkComplete(table, countries):
+    assert set(table.points) == set(countries)
+    for c in countries:
+        assert table.points[c] == 3 * len(table.wins[c])
+        assert table.chances[c] == c.win_chance
+    for i, a in enumerate(countries):
+        for b in countries[i + 1:]:
+            assert (b in table.wins[a]) != (a in table.wins[b])
+
+
+def test_league_table_replays_the_edited_country():
+    countries = SyntheticCountries(20, random.Random(7))
+    edited = countries[7]
+    others = [c for c in countries if c is not edited]
+    expected = 3 * sum(600 / (600 + c.win_chance) for c in others)
+
+    rng = random.Random(8)
+    incremental = []
+    fresh = []
+    for run in range(300):
+        edited.win_chance = 50
+        table = LeagueTable()
+        table.Update(countries, rng)
+        kept = {c: set(table.wins[c]) - {edited} for c in others}
+
+        edited.win_chance = 600
+        points = table.Update(countries, rng)
+        assert table.played == len(countries) - 1
+        _checkComplete(table, countries)
+        assert {c: table.wins[c] - {edited} for c in others} == kept
+        incremental.append(points[edited])
+
+        new = LeagueTable()
+        fresh.append(new.Update(countries, rng)[edited])
+        _checkComplete(new, countries)
+
+    # both are a league with the new chance, 3 points for each of 19
+    # matches, the mean of 300 runs is well within 1.5 points
+    assert abs(sum(incremental) / 300 - expected) < 1.5
+    assert abs(sum(fresh) / 300 - expected) < 1.5
+
+
+def test_league_table_drops_removed_countries():
+    countries = SyntheticCountries(15, random.Random(9))
+    table = LeagueTable()
+    rng = random.Random(10)
+    table.Update(countries, rng)
+    del countries[4]
+    countries += SyntheticCountries(2, random.Random(11))
+    table.Update(countries, rng)
+    assert table.played == 14 + 15
+    _checkComplete(table, countries)
+
+
+# each team is a million times stronger than the one before, so it beats
+# all the weaker ones and loses to the others: the points of the team of
+# rank r are 3 r only if it met each weaker team once, the ranks are
+# shuffled so a pair met twice or never shows up in some run
+def test_elo_league_plays_a_round_robin():
+    region = GetRegions()[0]
+    rng = random.Random(12)
+    rules = DefaultRules()
+    rules['SeedersOn'] = False
+    for n in (3, 5, 8, 9, 33):
+        for run in range(20):
+            ranks = list(range(n))
+            rng.shuffle(ranks)
+            pool = CountryTable([Country(str(r), region, False,
+                                         10.0 ** (6 * r)) for r in ranks])
+            league = EloLeague(rules, pool, [], rng=rng)
+            assert [p for p, rating in league.points] == [3 * r for r in ranks]
+
+
+
+# small blocks and no minimum, so a small league is shared by the workers
+def test_parallel_league_same_for_any_workers(monkeypatch):
+    blocks = gen.LeagueBlocks
+    play_shared = ParallelLeague._playShared
+    shared = []
+
+    def playShared(self, *args):
+        shared.append(self.workers)
+        return play_shared(self, *args)
+
+    monkeypatch.setattr(gen, 'LeagueBlocks', lambda n: blocks(n, 2000))
+    monkeypatch.setattr(gen, 'PARALLEL_MIN_MATCHES', 0)
+    monkeypatch.setattr(ParallelLeague, '_playShared', playShared)
+
+    pool = _pool(300)
+    rules = DefaultRules()
+    for seed in range(2):
+        points = [ParallelLeague(rules, pool, [], rng=random.Random(seed),
+                                 workers=workers).points
+                  for workers in (1, 2, 3)]
+        assert points[0] == points[1] == points[2]
+        assert sum(points[0]) == 3 * 300 * 299 // 2
+    assert shared == [2, 3, 2, 3]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+# the picks of the generation methods keep the rules
+
+import random
+from collections import Counter
+
+from data import Country, CountryTable, GetRegions, SyntheticCountries
+from gen import AliasTable, AllRandom, DefaultRules, GenerateCup, SuperLeague
+from gen import WeightedRandom
+
+# chi-square of 5 degrees of freedom with p = 0.001
+CHI2_5 = 20.52
+
+
+def _chiSquare(counts, weights):
+    n = sum(counts)
+    total = sum(weights)
+    return sum((c - n * w / total) ** 2 / (n * w / total)
+               for c, w in zip(counts, weights))
+
+
+def test_picks_keep_the_rules():
+    countries = SyntheticCountries(120, random.Random(2))
+    pool = CountryTable(countries)
+    regions = GetRegions()
+    rules = DefaultRules()
+    rules['max'][regions[0].id] = 3
+    rules['max'][regions[1].id] = 5
+    fmt = rules['format']
+    for method in (AllRandom, SuperLeague):
+        for seed in range(30):
+            rng = random.Random(seed)
+            freezed = dict(zip(rng.sample(range(fmt.teams), 4),
+                               rng.sample(countries, 4)))
+            cup = GenerateCup(method, rules, pool, freezed, rng)
+            assert len(set(map(id, cup))) == fmt.teams
+            for i, c in freezed.items():
+                assert cup[i] is c
+            for i, c in enumerate(cup):
+                if fmt.IsSeederSlot(i) and i not in freezed:
+                    assert c.seeder
+            by_region = Counter(c.region.id for c in cup)
+            for r in regions:
+                assert by_region[r.id] <= rules['max'][r.id]
+
+
+def test_alias_table_draws_by_weight():
+    weights = [1, 2, 3, 4, 5, 15]
+    table = AliasTable(weights)
+    rnd = random.Random(3).random
+    counts = [0] * len(weights)
+    for i in range(60000):
+        counts[table.draw(rnd)] += 1
+    assert _chiSquare(counts, weights) < CHI2_5
+
+
+def test_weighted_random_picks_by_win_chance():
+    region = GetRegions()[0]
+    weights = [1, 2, 3, 4, 5, 15]
+    countries = [Country(str(w), region, False, w) for w in weights]
+    pool = CountryTable(countries)
+    rules = DefaultRules()
+    rules['SeedersOn'] = False
+    rng = random.Random(4)
+    counts = [0] * len(weights)
+    # the second pick after the first took the heaviest, drawn on the
+    # same alias table without it
+    second = [0] * (len(weights) - 1)
+    for i in range(20000):
+        method = WeightedRandom(rules, pool, [], rng=rng)
+        first = method.GetSelections(1)[0]
+        counts[pool.Index(first)] += 1
+        if first is countries[-1]:
+            second[pool.Index(method.GetSelections(1)[0])] += 1
+    assert _chiSquare(counts, weights) < CHI2_5
+    # 4 degrees of freedom, p = 0.001
+    assert _chiSquare(second, weights[:-1]) < 18.47
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# QuotaPlan against a brute force over how many countries each region
+# gives to the seeder and to the other slots
+
+import random
+from functools import lru_cache
+
+from data import Country, CupFormat, GetRegions
+from gen import DefaultRules
+from quota import QuotaPlan
+
+REGIONS = GetRegions()[:3]
+
+
+# True if nSeeders and nOthers slots can be filled, state is a tuple of
+# (seeders, non seeders, minimum, maximum) by region
+@lru_cache(maxsize=None)
+def _feasible(state, nSeeders, nOthers, apart):
+    if not state:
+        return nSeeders == 0 and nOthers == 0
+    (a, b, lo, hi), rest = state[0], state[1:]
+    for s in range(min(a, nSeeders) + 1):
+        # seeders in the other slots, none when apart
+        for t in range((0 if apart else min(a - s, nOthers)) + 1):
+            for u in range(min(b, nOthers - t) + 1):
+                if (lo <= s + t + u <= hi and
+                        _feasible(rest, nSeeders - s, nOthers - t - u,
+                                  apart)):
+                    return True
+    return False
+
+
+def _randomCase(rng, apart):
+    rules = DefaultRules(CupFormat(2, 4, 1))
+    rules['SeparateRegions'] = apart
+    rules['group_max'] = {r.id: 8 for r in REGIONS}
+    countries = []
+    state = []
+    for r in REGIONS:
+        a, b = rng.randint(0, 3), rng.randint(0, 4)
+        countries += [Country(r.id, r, True) for i in range(a)]
+        countries += [Country(r.id, r, False) for i in range(b)]
+        lo = rng.choice([0, 0, 1, 2, 3])
+        hi = rng.choice([1, 2, 3, 8])
+        rules['mins'][r.id] = lo
+        rules['max'][r.id] = hi
+        state.append([a, b, lo, hi])
+    return rules, countries, state
+
+
+def _check(apart):
+    rng = random.Random(5 if apart else 6)
+    for case in range(400):
+        rules, countries, state = _randomCase(rng, apart)
+        nSeeders, nOthers = rng.randint(0, 2), rng.randint(0, 5)
+        plan = QuotaPlan(rules, countries, [], nSeeders, nOthers)
+        feasible = _feasible(tuple(map(tuple, state)), nSeeders, nOthers,
+                             apart)
+        assert (plan.Problem() is None) == feasible
+        if not feasible:
+            continue
+
+        idle = not plan.NeedsChecks()
+        while nSeeders + nOthers:
+            isSeeder = nSeeders > 0 and (nOthers == 0 or rng.random() < .5)
+            options = []
+            for code, r in enumerate(REGIONS):
+                a, b, lo, hi = state[code]
+                for seeder, left in ((True, a), (False, b)):
+                    # the buckets never offer a non seeder to a seeder slot
+                    if left == 0 or hi == 0 or isSeeder and not seeder:
+                        continue
+                    after = [list(s) for s in state]
+                    after[code] = [a - seeder, b - (not seeder),
+                                   max(0, lo - 1), hi - 1]
+                    ok = (not apart or seeder == isSeeder) and _feasible(
+                        tuple(map(tuple, after)),
+                        nSeeders - isSeeder, nOthers - (not isSeeder), apart)
+                    assert plan.CanTake(r.id, seeder, isSeeder) == ok
+                    if plan.AnyPickIsSafe() or idle:
+                        assert ok or apart and seeder != isSeeder
+                    if ok:
+                        options.append((code, seeder, after[code]))
+            assert options
+            code, seeder, state[code] = rng.choice(options)
+            plan.Take(REGIONS[code].id, seeder, isSeeder)
+            if isSeeder:
+                nSeeders -= 1
+            else:
+                nOthers -= 1
+
+
+def test_plan_matches_brute_force():
+    _check(apart=False)
+
+
+def test_plan_with_seeders_apart_matches_brute_force():
+    _check(apart=True)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+# the first knockout round never pairs two teams of the same group
+
+import random
+
+from data import CupFormat
+from tournament import KnockoutBracket, KnockoutSize
+
+
+def test_first_round_pairs_other_groups():
+    rng = random.Random(0)
+    for groups, size in [(12, 4), (6, 4), (3, 4), (2, 8), (5, 3), (10, 2)]:
+        knockout = KnockoutSize(CupFormat(groups, size, 1))
+        for run in range(200):
+            standings = [rng.sample(range(g * size, (g + 1) * size), size)
+                         for g in range(groups)]
+            qualifiers = []
+            for place in range(size):
+                row = [s[place] for s in standings]
+                rng.shuffle(row)
+                qualifiers += row
+            qualifiers = qualifiers[:knockout]
+
+            bracket = KnockoutBracket(qualifiers, size)
+            assert sorted(bracket) == sorted(qualifiers)
+            for a, b in zip(bracket[::2], bracket[1::2]):
+                assert a // size != b // size